@@ -0,0 +1,211 @@
+import time
+import numpy as np
+from argparse import ArgumentParser, Namespace
+
+from pathfinding.classes import (
+    CoarseToFineGrid,
+    Grid,
+    HierarchicalGrid,
+    Rect,
+    TileAttribute,
+)
+
+
+def get_args() -> Namespace:
+    parser = ArgumentParser(
+        prog="GBT benchmarks", description="Benchmark path finding on synthetic grids"
+    )
+    parser.add_argument(
+        "--sizes",
+        help="Widths (and heights) of the synthetic grids",
+        action="store",
+        type=int,
+        nargs="+",
+        default=[1000, 4000, 8000],
+    )
+    parser.add_argument(
+        "--route-length",
+        help="Distance in tiles between the start and end of the benchmarked route",
+        action="store",
+        type=int,
+        default=200,
+    )
+    parser.add_argument(
+        "--weights-size",
+        help="Width (and height) of the grid used to benchmark weight initialisation",
+        action="store",
+        type=int,
+        default=3163,  # about 10^7 tiles
+    )
+    parser.add_argument(
+        "--searches",
+        help="Amount of short back-to-back searches to benchmark per grid",
+        action="store",
+        type=int,
+        default=1000,
+    )
+    parser.add_argument(
+        "--cluster-size",
+        help="Width (and height) in tiles of the clusters used for hierarchical path finding",
+        action="store",
+        type=int,
+        default=64,
+    )
+    parser.add_argument(
+        "--coarse-factor",
+        help="How many tiles wide the coarse tiles used for coarse-to-fine path finding are",
+        action="store",
+        type=int,
+        default=4,
+    )
+    parser.add_argument(
+        "--seed",
+        help="Seed for the random tile weights",
+        action="store",
+        type=int,
+        default=0,
+    )
+    return parser.parse_args()
+
+
+def synthetic_grid(size: int, seed: int, sparse_search: bool = False) -> Grid:
+    """Create a fully registered grid with random weights between 1 and 10."""
+
+    grid = Grid(Rect(size, size), sparse_search=sparse_search)
+    rng = np.random.default_rng(seed)
+    grid._registered[...] = True
+    grid._base_weights[...] = rng.integers(1, 11, size=(size, size))
+    grid._weights[...] = grid._base_weights
+    return grid
+
+
+def benchmark_find_path(grid: Grid, route_length: int, bidirectional: bool = False):
+    """Time a horizontal route through the middle of the grid."""
+
+    center = grid.dimensions.width // 2, grid.dimensions.height // 2
+    from_pos = (max(center[0] - route_length // 2, 0), center[1])
+    to_pos = (min(center[0] + route_length // 2, grid.dimensions.width - 1), center[1])
+
+    start = time.perf_counter()
+    path = grid.find_path(from_pos, to_pos, bidirectional=bidirectional)
+    elapsed = time.perf_counter() - start
+
+    expansions = grid.visited_count()
+    mode = "bidirectional " if bidirectional else ""
+    print(
+        f"{mode}find_path: {len(path)} tiles, cost {grid.get_cost(to_pos):.0f}, "
+        f"{expansions} expansions in {elapsed:.2f}s "
+        f"({expansions / elapsed:.0f} expansions/s)"
+    )
+
+
+def benchmark_hierarchical(grid: Grid, route_length: int, cluster_size: int):
+    """Time building the abstract graph and finding the same route hierarchically."""
+
+    center = grid.dimensions.width // 2, grid.dimensions.height // 2
+    from_pos = (max(center[0] - route_length // 2, 0), center[1])
+    to_pos = (min(center[0] + route_length // 2, grid.dimensions.width - 1), center[1])
+    hierarchical = HierarchicalGrid(grid, cluster_size)
+
+    start = time.perf_counter()
+    hierarchical.find_path(from_pos, to_pos)
+    elapsed_first = time.perf_counter() - start
+    start = time.perf_counter()
+    path = hierarchical.find_path(from_pos, to_pos)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"hierarchical find_path: {len(path)} tiles, cost {grid.get_cost(to_pos):.0f}, "
+        f"{grid.visited_count()} expansions in {elapsed:.2f}s "
+        f"({elapsed_first:.2f}s including {hierarchical.node_count()} node abstract graph)"
+    )
+
+
+def benchmark_coarse_to_fine(grid: Grid, route_length: int, factor: int):
+    """Time finding the same route on a downsampled grid first, and then around that path."""
+
+    center = grid.dimensions.width // 2, grid.dimensions.height // 2
+    from_pos = (max(center[0] - route_length // 2, 0), center[1])
+    to_pos = (min(center[0] + route_length // 2, grid.dimensions.width - 1), center[1])
+    coarse_to_fine = CoarseToFineGrid(grid, factor)
+
+    start = time.perf_counter()
+    path = coarse_to_fine.find_path(from_pos, to_pos)
+    elapsed = time.perf_counter() - start
+
+    expansions = grid.visited_count() + coarse_to_fine.coarse_grid.visited_count()
+    print(
+        f"coarse-to-fine find_path: {len(path)} tiles, cost {grid.get_cost(to_pos):.0f}, "
+        f"{expansions} expansions in {elapsed:.2f}s"
+    )
+
+
+def benchmark_init_weights(size: int, seed: int):
+    """Time deriving the weights of all tiles from random attribute bitmasks."""
+
+    grid = synthetic_grid(size, seed)
+    rng = np.random.default_rng(seed)
+    grid._attributes[...] = rng.integers(0, 1 << len(TileAttribute), size=(size, size))
+    attribute_weights = {attribute: 10.0 for attribute in TileAttribute}
+
+    start = time.perf_counter()
+    grid._init_weights_from_attributes(attribute_weights)
+    elapsed = time.perf_counter() - start
+
+    tiles = size * size
+    print(
+        f"_init_weights_from_attributes: {tiles} tiles in {elapsed:.2f}s "
+        f"({tiles / elapsed:.0f} tiles/s)"
+    )
+
+
+def benchmark_memory(size: int):
+    """Report the memory used per tile by the default and compact memory layouts."""
+
+    for compact in [False, True]:
+        grid = Grid(Rect(size, size), compact=compact)
+        grid.register_remaining_tiles(base_weight=1)
+        # The search state is only allocated once a search runs
+        grid.find_path((0, 0), (1, 1))
+        layout = "compact" if compact else "default"
+        print(f"{layout} layout: {grid.bytes_per_tile():.1f} bytes per tile")
+
+
+def benchmark_repeated_searches(size: int, seed: int, count: int):
+    """Time many short searches on one big grid, with a dense and a sparse search state."""
+
+    for sparse_search in [False, True]:
+        grid = synthetic_grid(size, seed, sparse_search=sparse_search)
+        rng = np.random.default_rng(seed)
+        starts = rng.integers(10, size - 10, size=(count, 2))
+
+        start = time.perf_counter()
+        for x, y in starts:
+            grid.find_path((int(x), int(y)), (int(x) + 5, int(y) + 5))
+        elapsed = time.perf_counter() - start
+
+        state = "sparse" if sparse_search else "dense"
+        print(
+            f"{count} short searches with a {state} search state in {elapsed:.2f}s "
+            f"({elapsed / count * 1000:.2f}ms per search)"
+        )
+
+
+def main():
+    args = get_args()
+    benchmark_memory(args.sizes[0])
+    print()
+    print(f"{args.weights_size}x{args.weights_size} grid")
+    benchmark_init_weights(args.weights_size, args.seed)
+    for size in args.sizes:
+        print(f"\n{size}x{size} grid")
+        grid = synthetic_grid(size, args.seed)
+        benchmark_find_path(grid, args.route_length)
+        benchmark_find_path(grid, args.route_length, bidirectional=True)
+        benchmark_hierarchical(grid, args.route_length, args.cluster_size)
+        benchmark_coarse_to_fine(grid, args.route_length, args.coarse_factor)
+        benchmark_repeated_searches(size, args.seed, args.searches)
+
+
+if __name__ == "__main__":
+    main()
@@ -28,8 +28,10 @@
           flake8
           pylint
           black
+          pytest
           geopandas
           numpy
+          scipy
           gdal
           jsonschema
         ]))
@@ -3,7 +3,7 @@ import os
 import math
 import shutil
 from jsonschema import validate
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from random import randint
 from argparse import ArgumentParser, Namespace
 
@@ -11,12 +11,30 @@ from .constants import (
     layers,
     layers_dict,
     BGT_DATA_PATH,
+    CACHE_MANIFEST_PATH,
     CONFIG_DATA_PATH,
+    GEOJSON_DATA_PATH,
     GPKG_DATA_PATH,
+    GRID_DATA_PATH,
     TIFF_DATA_PATH,
 )
-from .classes import Grid, Point, Rect, TileData, TiffReader, TileAttribute, Visualizer
-from .helpers import download_bgt_data, wkt_rect_from_corners
+from .classes import (
+    CacheManifest,
+    CoarseToFineGrid,
+    Grid,
+    HierarchicalGrid,
+    IncrementalPlanner,
+    ParallelPathFinder,
+    Point,
+    Rect,
+    TileData,
+    TiffReader,
+    TiffWriter,
+    TileAttribute,
+    Visualizer,
+    VisitState,
+)
+from .helpers import bgt_hash, download_bgt_data, grid_hash, wkt_rect_from_corners
 
 
 def parse_rdc(arg: List[str]) -> Tuple[int, int]:
@@ -36,6 +54,112 @@ def get_args() -> Namespace:
         help="Remove all files from the cache",
         action="store_true",
     )
+    parser.add_argument(
+        "--cache-budget",
+        help="Maximum size of the cache in GB, beyond which the least recently used files are removed",
+        action="store",
+        type=float,
+        required=False,
+    )
+    parser.add_argument(
+        "--single-pass",
+        help="Rasterize all features of a layer into one TIFF file, with a band per feature",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Amount of processes used to linearize and rasterize the layers, and to find partitions",
+        action="store",
+        type=int,
+        required=False,
+        default=1,
+    )
+    parser.add_argument(
+        "--download-jobs",
+        help="Amount of BGT tiles to download at the same time",
+        action="store",
+        type=int,
+        required=False,
+        default=4,
+    )
+    parser.add_argument(
+        "--convert-bgt",
+        help="Convert the downloaded BGT data into linearized GeoPackages while extracting it",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--compact",
+        help="Use a compact memory layout for the grid, at the cost of float32 precision",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--sparse-search",
+        help="Keep the path finding state in dictionaries, which suits short paths on big grids",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--bidirectional",
+        help="Search from both ends of a path at once, which expands fewer tiles on long paths",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--incremental",
+        help="Keep the search between paths and only search again where the weights changed, which suits --paths and --partitions",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--verify-heuristic",
+        help="Check that the A* heuristic never overestimates the cost along the found paths, for debugging",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cluster-size",
+        help="Find paths hierarchically, first on clusters of this size in meters and then at full resolution",
+        action="store",
+        type=float,
+        required=False,
+    )
+    parser.add_argument(
+        "--coarse-factor",
+        help="Find paths on a grid with tiles this many times as large first, and then at full resolution around that path",
+        action="store",
+        type=int,
+        required=False,
+    )
+    parser.add_argument(
+        "--pooling",
+        help="How the weights of the coarse tiles are computed from the tiles they cover",
+        action="store",
+        choices=["min", "mean"],
+        default="mean",
+    )
+    parser.add_argument(
+        "--corridor-radius",
+        help="Radius in meters of the corridor around the coarse path that is searched at full resolution (default: one coarse tile)",
+        action="store",
+        type=float,
+        required=False,
+    )
+    parser.add_argument(
+        "--cost-surface",
+        help="Find the costs of all tiles from the start, and write them and the direction to the previous tile on their path as TIFF files",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--max-cost",
+        help="With --cost-surface, only find the costs of tiles up to this cost",
+        action="store",
+        type=float,
+        required=False,
+    )
+    parser.add_argument(
+        "--search-area",
+        help="RDCs of the corners of a polygon to which the search is limited: x,y x,y x,y ...",
+        nargs="+",
+        action="store",
+        required=False,
+    )
     parser.add_argument(
         "-m",
         "--existing-path-multiplier",
@@ -138,6 +262,15 @@ def get_args() -> Namespace:
     except:
         print("Invalid start RDC")
         exit(1)
+    if args.search_area is not None:
+        try:
+            args.search_area = [parse_rdc([corner]) for corner in args.search_area]
+        except:
+            print("Invalid search area RDC")
+            exit(1)
+        if len(args.search_area) < 3:
+            print("The search area must have at least 3 corners.")
+            exit(1)
 
     if args.existing_path_multiplier < 1.0:
         print(
@@ -153,6 +286,43 @@ def get_args() -> Namespace:
         print("Maximum path length cannot be negative.")
         exit(1)
 
+    if args.max_length is not None and args.bidirectional:
+        print("Bidirectional search cannot be combined with a maximum path length.")
+        exit(1)
+
+    if args.incremental and (
+        args.max_length is not None
+        or args.bidirectional
+        or args.cluster_size is not None
+        or args.coarse_factor is not None
+    ):
+        print(
+            "Incremental search cannot be combined with a maximum path length, bidirectional search, cluster size or coarse factor."
+        )
+        exit(1)
+
+    if args.cost_surface and (
+        args.max_length is not None
+        or args.bidirectional
+        or args.incremental
+        or args.cluster_size is not None
+        or args.coarse_factor is not None
+        or args.paths > 1
+        or args.partitions > 1
+    ):
+        print(
+            "A cost surface cannot be combined with a maximum path length, bidirectional or incremental search, cluster size, coarse factor, multiple paths or partitions."
+        )
+        exit(1)
+
+    if args.max_cost is not None and not args.cost_surface:
+        print("A maximum cost can only be used with a cost surface.")
+        exit(1)
+
+    if args.max_cost is not None and args.max_cost < 0.0:
+        print("Maximum cost cannot be negative.")
+        exit(1)
+
     if args.output_name == "":
         print("Please provide an output name.")
         exit(1)
@@ -161,6 +331,22 @@ def get_args() -> Namespace:
         print("Padding cannot be negative.")
         exit(1)
 
+    if args.cluster_size is not None and args.cluster_size < 2 * args.resolution:
+        print("Clusters must be at least 2 tiles wide.")
+        exit(1)
+
+    if args.coarse_factor is not None and args.coarse_factor < 2:
+        print("Coarse factor must be at least 2.")
+        exit(1)
+
+    if args.coarse_factor is not None and args.cluster_size is not None:
+        print("Coarse factor and cluster size cannot be combined.")
+        exit(1)
+
+    if args.corridor_radius is not None and args.corridor_radius < 0.0:
+        print("Corridor radius cannot be negative.")
+        exit(1)
+
     if args.partitions < 1:
         print("Must have at least one partition.")
         exit(1)
@@ -177,6 +363,18 @@ def get_args() -> Namespace:
         print("Must have at least one path to generate.")
         exit(1)
 
+    if args.jobs < 1:
+        print("Must have at least one job.")
+        exit(1)
+
+    if args.download_jobs < 1:
+        print("Must have at least one download job.")
+        exit(1)
+
+    if args.cache_budget is not None and args.cache_budget < 0.0:
+        print("Cache budget cannot be negative.")
+        exit(1)
+
     if args.resolution <= 0.0:
         print("Resolution must be positive.")
         exit(1)
@@ -243,9 +441,204 @@ def get_config() -> object:
 
 
 def clear_cache():
-    shutil.rmtree(BGT_DATA_PATH)
-    shutil.rmtree(GPKG_DATA_PATH)
-    shutil.rmtree(TIFF_DATA_PATH)
+    for path in [BGT_DATA_PATH, GPKG_DATA_PATH, TIFF_DATA_PATH, GRID_DATA_PATH]:
+        if os.path.exists(path):
+            shutil.rmtree(path)
+    if os.path.exists(CACHE_MANIFEST_PATH):
+        os.remove(CACHE_MANIFEST_PATH)
+
+
+def record_layers(
+    manifest: CacheManifest,
+    wkt_rect: str,
+    resolution: float,
+    bounds: Tuple[int, int, int, int],
+    single_pass: bool,
+) -> List[str]:
+    """
+    Record the BGT tiles, GeoPackages and tiffs of all layers in the cache manifest.
+
+    Returns the keys of the tiffs.
+    """
+    bgt_layers = [layer.layer_name for layer in layers]
+    # A BGT tile is only usable as a whole, so its zip and the files of all layers form one entry
+    tile_files = {}
+    gpkg_dependencies = {}
+    for layer in layers:
+        gpkg = layer.gpkg_filename(wkt_rect, bgt_layers, GPKG_DATA_PATH)
+        gpkg_dependencies[gpkg] = []
+        for tile, filename in layer.tiles(wkt_rect, bgt_layers, BGT_DATA_PATH):
+            zip = os.path.join(BGT_DATA_PATH, f"{bgt_hash(tile, bgt_layers)}.zip")
+            tile_files.setdefault(zip, [zip]).append(filename)
+            gpkg_dependencies[gpkg].append(zip)
+    for zip, files in tile_files.items():
+        manifest.record(zip, files)
+    for gpkg, dependencies in gpkg_dependencies.items():
+        if os.path.exists(gpkg):
+            manifest.record(gpkg, dependencies=dependencies)
+
+    tiffs = []
+    for layer in layers:
+        gpkg = layer.gpkg_filename(wkt_rect, bgt_layers, GPKG_DATA_PATH)
+        for tiff in layer.tiff_filenames(
+            wkt_rect, resolution, bgt_layers, single_pass, TIFF_DATA_PATH, bounds
+        ):
+            if os.path.exists(tiff):
+                manifest.record(tiff, dependencies=[gpkg])
+                tiffs.append(tiff)
+    return tiffs
+
+
+def update_cache(
+    wkt_rect: str,
+    resolution: float,
+    bounds: Tuple[int, int, int, int],
+    single_pass: bool,
+    grid_key: str,
+    built: bool,
+    cache_budget: Optional[int] = None,
+):
+    """
+    Record the grid, and the files it was built from if it was just built, in the cache manifest.
+
+    With a cache budget in bytes, evict the least recently used files until the cache fits within it.
+    The grid itself is never evicted, since it is in use.
+    """
+    grid_files = grid_cache_files(grid_key)
+    with CacheManifest(CACHE_MANIFEST_PATH) as manifest:
+        if built:
+            dependencies = record_layers(
+                manifest, wkt_rect, resolution, bounds, single_pass
+            )
+        else:
+            dependencies = manifest.dependencies(grid_files[0])
+        manifest.record(grid_files[0], grid_files, dependencies)
+        evict_cache(manifest, cache_budget, [grid_files[0]])
+
+
+def record_graph(grid: Grid, filename: str, cache_budget: Optional[int] = None):
+    """
+    Record a cached HPA graph in the cache manifest, as made from the grid, see HierarchicalGrid.
+
+    With a cache budget in bytes, evict the least recently used files until the cache fits within it.
+    The grid and the graph are never evicted, since they are in use.
+    """
+    grid_file = grid_cache_files(grid.cache_key)[0]
+    with CacheManifest(CACHE_MANIFEST_PATH) as manifest:
+        manifest.record(filename, dependencies=[grid_file])
+        evict_cache(manifest, cache_budget, [grid_file, filename])
+
+
+def grid_cache_files(grid_key: str) -> List[str]:
+    """Get the files of a cached grid, of which the first is its key in the cache manifest."""
+    return [
+        os.path.join(GRID_DATA_PATH, f"{grid_key}_{name}.npy")
+        for name in ["attributes", "registered"]
+    ]
+
+
+def evict_cache(
+    manifest: CacheManifest, cache_budget: Optional[int], keep: List[str]
+) -> None:
+    """Evict the least recently used entries, except those in keep, until the cache fits within the budget."""
+    if cache_budget is None:
+        return
+    removed, removed_size = manifest.evict(cache_budget, keep=keep)
+    if removed > 0:
+        print(
+            f"Evicted {removed} cached entries ({removed_size / 1e6:.1f} MB) to stay within the cache budget"
+        )
+
+
+def load_grid(
+    wkt_rect: str,
+    bounds: Tuple[int, int, int, int],
+    resolution: float,
+    single_pass: bool = False,
+    jobs: int = 1,
+    download_jobs: int = 4,
+    convert_bgt: bool = False,
+    cache_budget: Optional[int] = None,
+    compact: bool = False,
+    sparse_search: bool = False,
+) -> Optional[Grid]:
+    """
+    Load the grid for the given bounds from the cache.
+
+    If it is not cached, download and rasterize the BGT data, load it into a new grid and cache that.
+    Returns None if the download failed.
+    The cache is kept within cache_budget bytes, if given, see update_cache.
+    """
+
+    grid_x_min, grid_y_min, grid_x_max, grid_y_max = bounds
+    grid_width = grid_x_max - grid_x_min
+    grid_height = grid_y_max - grid_y_min
+
+    # The grid is made from the tiffs of all layers, so its key covers theirs
+    bgt_layers = [layer.layer_name for layer in layers]
+    tiffs = [
+        os.path.basename(tiff)
+        for layer in layers
+        for tiff in layer.tiff_filenames(
+            wkt_rect, resolution, bgt_layers, single_pass, outputBounds=bounds
+        )
+    ]
+    grid_key = grid_hash(tiffs, [layer.definition for layer in layers], single_pass)
+    grid = Grid.load(
+        GRID_DATA_PATH, grid_key, compact=compact, sparse_search=sparse_search
+    )
+    if grid is not None:
+        print(f"Loaded {grid_width}x{grid_height}m grid from cache")
+        update_cache(
+            wkt_rect, resolution, bounds, single_pass, grid_key, False, cache_budget
+        )
+        return grid
+
+    grid_zoomed_width = math.ceil(grid_width / resolution)
+    grid_zoomed_height = math.ceil(grid_height / resolution)
+    grid = Grid(
+        Rect(grid_zoomed_width, grid_zoomed_height),
+        compact=compact,
+        sparse_search=sparse_search,
+    )
+
+    print(f"Downloading BGT data for a {grid_width}x{grid_height}m grid..")
+    success, reason = download_bgt_data(
+        wkt_rect,
+        bgt_layers,
+        jobs=download_jobs,
+        convert=convert_bgt,
+    )
+    if success:
+        if reason:
+            print(f"Download successful: {reason}")
+        else:
+            print("Download successful")
+    else:
+        print(f"Download failed: {reason}")
+        return None
+
+    print(
+        f"\nRasterizing to TIFF files and loading into {grid_width}x{grid_height}m grid.."
+    )
+    TiffReader.read_layers(
+        grid,
+        layers,
+        wkt_rect,
+        resolution,
+        input_dir=BGT_DATA_PATH,
+        gpkg_dir=GPKG_DATA_PATH,
+        output_dir=TIFF_DATA_PATH,
+        outputBounds=bounds,
+        single_pass=single_pass,
+        jobs=jobs,
+        bgt_layers=bgt_layers,
+    )
+    grid.save(GRID_DATA_PATH, grid_key)
+    update_cache(
+        wkt_rect, resolution, bounds, single_pass, grid_key, True, cache_budget
+    )
+    return grid
 
 
 def main():
@@ -274,45 +667,127 @@ def main():
     grid_height = grid_y_max - grid_y_min
     wkt_rect = wkt_rect_from_corners((grid_x_min, grid_y_min), (grid_x_max, grid_y_max))
 
-    grid_zoomed_width = math.ceil(grid_width / args.resolution)
     grid_zoomed_height = math.ceil(grid_height / args.resolution)
-    grid = Grid(Rect(grid_zoomed_width, grid_zoomed_height))
-
-    print(f"Downloading BGT data for a {grid_width}x{grid_height}m grid..")
-    success, reason = download_bgt_data(
+    cache_budget = None if args.cache_budget is None else int(args.cache_budget * 1e9)
+    grid = load_grid(
         wkt_rect,
-        [layer.layer_name for layer in layers],
+        (grid_x_min, grid_y_min, grid_x_max, grid_y_max),
+        args.resolution,
+        single_pass=args.single_pass,
+        jobs=args.jobs,
+        download_jobs=args.download_jobs,
+        convert_bgt=args.convert_bgt,
+        cache_budget=cache_budget,
+        compact=args.compact,
+        sparse_search=args.sparse_search,
     )
-    if success:
-        if reason:
-            print(f"Download successful: {reason}")
-        else:
-            print("Download successful")
-    else:
-        print(f"Download failed: {reason}")
+    if grid is None:
         return
+    c = grid.register_remaining_tiles(base_weight=config["unregistered_weight"])
+    print(f"{c} unregistered tiles")
 
-    print(
-        f"\nRasterizing to TIFF files and loading into {grid_width}x{grid_height}m grid.."
+    from_pos = (
+        int(
+            (
+                path_width_offset
+                if path_x_start < path_x_end
+                else (grid_width - path_width_offset)
+            )
+            / args.resolution
+        ),
+        int(
+            (
+                path_height_offset
+                if path_y_start > path_y_end
+                else (grid_height - path_height_offset)
+            )
+            / args.resolution
+        ),
     )
-    for layer in layers:
-        TiffReader.read_tiffs(
+    to_pos = (
+        int(
+            (
+                (grid_width - path_width_offset)
+                if path_x_start < path_x_end
+                else path_width_offset
+            )
+            / args.resolution
+        ),
+        int(
+            (
+                (grid_height - path_height_offset)
+                if path_y_start > path_y_end
+                else path_height_offset
+            )
+            / args.resolution
+        ),
+    )
+    geotransform = (
+        grid_x_min,
+        args.resolution,
+        0,
+        grid_y_min,
+        0,
+        args.resolution,
+        grid_zoomed_height,
+    )
+
+    search_mask = None
+    if args.search_area is not None:
+        search_mask = grid.polygon_mask(
+            [
+                ((x - grid_x_min) / args.resolution, (grid_y_max - 1 - y) / args.resolution)
+                for x, y in args.search_area
+            ]
+        )
+
+    if args.cost_surface:
+        print("\nFinding the costs of all tiles from the start..")
+        c = grid.find_costs(
+            from_pos,
+            max_cost=args.max_cost,
+            path_cost=args.path_cost * args.resolution,
+            attribute_weights=config["attribute_weights"],
+            mask=search_mask,
+        )
+        print(f"{c} tiles reached")
+        cost_dst, parents_dst = TiffWriter.write_cost_surface(
             grid,
-            layer,
-            wkt_rect,
+            os.path.join(GEOJSON_DATA_PATH, args.output_name),
+            (grid_x_min, grid_y_min, grid_x_max, grid_y_max),
             args.resolution,
-            input_dir=BGT_DATA_PATH,
-            gpkg_dir=GPKG_DATA_PATH,
-            output_dir=TIFF_DATA_PATH,
-            outputBounds=(grid_x_min, grid_y_min, grid_x_max, grid_y_max),
         )
-    c = 0
-    for x in range(grid.dimensions.width):
-        for y in range(grid.dimensions.height):
-            if not grid.get_registered((x, y)):
-                c += 1
-                grid.register_tile_at((x, y), base_weight=config["unregistered_weight"])
-    print(f"{c} unregistered tiles")
+        print(f"Cost surface written to {cost_dst} and {parents_dst}")
+
+        if grid.get_visit_state(to_pos) != VisitState.Visited:
+            print("Could not find a path to the end")
+            exit(1)
+        print("Transforming path to GEOJSON..")
+        Visualizer([grid.path_to(to_pos)], grid, geotransform).getGEOJSON(
+            args.output_name
+        )
+        return
+
+    pathfinder = grid
+    if args.cluster_size is not None:
+        pathfinder = HierarchicalGrid(
+            grid,
+            int(args.cluster_size / args.resolution),
+            cache_directory=GRID_DATA_PATH,
+        )
+    elif args.coarse_factor is not None:
+        pathfinder = CoarseToFineGrid(
+            grid,
+            args.coarse_factor,
+            pooling=args.pooling,
+            corridor_radius=1
+            if args.corridor_radius is None
+            else math.ceil(
+                args.corridor_radius / (args.resolution * args.coarse_factor)
+            ),
+        )
+    elif args.incremental:
+        pathfinder = IncrementalPlanner(grid)
 
     existing_paths = []
     for i in range(args.paths):
@@ -327,121 +802,70 @@ def main():
             ]
             print(f"Intervals: {intervals}")
 
-            for interval in intervals:
-                print(f"\nFinding path_2[{interval[0]},{interval[1]}]")
-                path = grid.find_path(
-                    (
-                        int(
-                            (
-                                path_width_offset
-                                if path_x_start < path_x_end
-                                else (grid_width - path_width_offset)
-                            )
-                            / args.resolution
-                        ),
-                        int(
-                            (
-                                path_height_offset
-                                if path_y_start > path_y_end
-                                else (grid_height - path_height_offset)
-                            )
-                            / args.resolution
-                        ),
-                    ),
-                    (
-                        int(
-                            (
-                                (grid_width - path_width_offset)
-                                if path_x_start < path_x_end
-                                else path_width_offset
-                            )
-                            / args.resolution
-                        ),
-                        int(
-                            (
-                                (grid_height - path_height_offset)
-                                if path_y_start > path_y_end
-                                else path_height_offset
-                            )
-                            / args.resolution
+            searches = [
+                (
+                    from_pos,
+                    to_pos,
+                    dict(
+                        max_length=None
+                        if args.max_length is None
+                        else args.max_length / args.resolution,
+                        path_cost=args.path_cost * args.resolution,
+                        existing_paths=[
+                            x[
+                                math.floor(interval[0] * len(x)) : math.ceil(
+                                    interval[1] * len(x)
+                                )
+                            ]
+                            for x in existing_paths
+                        ],
+                        existing_path_multiplier=args.existing_path_multiplier,
+                        existing_path_radius=int(
+                            args.existing_path_radius / args.resolution
                         ),
+                        attribute_weights=config["attribute_weights"],
+                        bidirectional=args.bidirectional,
+                        verify_heuristic=args.verify_heuristic,
+                        mask=search_mask,
                     ),
-                    max_length=None
-                    if args.max_length is None
-                    else args.max_length / args.resolution,
-                    path_cost=args.path_cost * args.resolution,
-                    existing_paths=[
-                        x[
-                            math.floor(interval[0] * len(x)) : math.ceil(
-                                interval[1] * len(x)
-                            )
-                        ]
-                        for x in existing_paths
-                    ],
-                    existing_path_multiplier=args.existing_path_multiplier,
-                    existing_path_radius=int(
-                        args.existing_path_radius / args.resolution
-                    ),
-                    attribute_weights=config["attribute_weights"],
                 )
+                for interval in intervals
+            ]
+
+            if args.jobs > 1 and pathfinder is grid:
+                # The partitions are independent, so they are found in parallel
+                print(
+                    f"\nFinding {len(intervals)} partitions in {args.jobs} processes.."
+                )
+                with ParallelPathFinder(grid, args.jobs) as parallel:
+                    results = parallel.find_paths(searches, geotransform)
+                for interval, (path, features) in zip(intervals, results):
+                    if path is None:
+                        print("Could not find any more paths")
+                        exit(1)
+                    print(
+                        f"Transforming path_2[{interval[0]},{interval[1]}] to GEOJSON.."
+                    )
+                    name = args.output_name
+                    name += f"_2[{interval[0]},{interval[1]}]"
+                    Visualizer.writeGEOJSON(features, name)
+                continue
+
+            for interval, (_, _, kwargs) in zip(intervals, searches):
+                print(f"\nFinding path_2[{interval[0]},{interval[1]}]")
+                path = pathfinder.find_path(from_pos, to_pos, **kwargs)
                 if path is None:
                     print("Could not find any more paths")
                     exit(1)
                 print("Transforming path to GEOJSON..")
                 name = args.output_name
                 name += f"_2[{interval[0]},{interval[1]}]"
-                Visualizer(
-                    [path],
-                    grid,
-                    (
-                        grid_x_min,
-                        args.resolution,
-                        0,
-                        grid_y_min,
-                        0,
-                        args.resolution,
-                        grid_zoomed_height,
-                    ),
-                ).getGEOJSON(name)
+                Visualizer([path], grid, geotransform).getGEOJSON(name)
         else:
             print(f"\nFinding path {i+1}..")
-            path = grid.find_path(
-                (
-                    int(
-                        (
-                            path_width_offset
-                            if path_x_start < path_x_end
-                            else (grid_width - path_width_offset)
-                        )
-                        / args.resolution
-                    ),
-                    int(
-                        (
-                            path_height_offset
-                            if path_y_start > path_y_end
-                            else (grid_height - path_height_offset)
-                        )
-                        / args.resolution
-                    ),
-                ),
-                (
-                    int(
-                        (
-                            (grid_width - path_width_offset)
-                            if path_x_start < path_x_end
-                            else path_width_offset
-                        )
-                        / args.resolution
-                    ),
-                    int(
-                        (
-                            (grid_height - path_height_offset)
-                            if path_y_start > path_y_end
-                            else path_height_offset
-                        )
-                        / args.resolution
-                    ),
-                ),
+            path = pathfinder.find_path(
+                from_pos,
+                to_pos,
                 max_length=None
                 if args.max_length is None
                 else args.max_length / args.resolution,
@@ -450,8 +874,16 @@ def main():
                 existing_path_multiplier=args.existing_path_multiplier,
                 existing_path_radius=int(args.existing_path_radius / args.resolution),
                 attribute_weights=config["attribute_weights"],
+                bidirectional=args.bidirectional,
+                verify_heuristic=args.verify_heuristic,
+                mask=search_mask,
             )
             existing_paths.append(path)
+            if (
+                isinstance(pathfinder, HierarchicalGrid)
+                and pathfinder.graph_filename is not None
+            ):
+                record_graph(grid, pathfinder.graph_filename, cache_budget)
 
             if path is None:
                 print("Could not find any more paths")
@@ -461,19 +893,7 @@ def main():
             name = args.output_name
             if args.paths > 1:
                 name += f"_{i+1}"
-            Visualizer(
-                [path],
-                grid,
-                (
-                    grid_x_min,
-                    args.resolution,
-                    0,
-                    grid_y_min,
-                    0,
-                    args.resolution,
-                    grid_zoomed_height,
-                ),
-            ).getGEOJSON(name)
+            Visualizer([path], grid, geotransform).getGEOJSON(name)
 
 
 if __name__ == "__main__":
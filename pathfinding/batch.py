@@ -0,0 +1,301 @@
+import csv
+import json
+import math
+from argparse import ArgumentParser, Namespace
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from .__main__ import clear_cache, get_config, load_grid
+from .classes import Visualizer
+from .helpers import wkt_rect_from_corners
+
+# A pair is the RDC of its start, the RDC of its end and the properties of its output feature
+Pair = Tuple[Tuple[float, float], Tuple[float, float], dict]
+
+
+def get_args() -> Namespace:
+    """Get the args from argparser and check them."""
+
+    parser = ArgumentParser(
+        prog="GBT batch",
+        description="Find GEOJSON paths in BGT data between many pairs of points, on a single grid",
+    )
+
+    parser.add_argument(
+        "pairs",
+        help="CSV file with start_x, start_y, end_x and end_y columns, or GEOJSON file with a LineString from start to end per pair, in RDC",
+        action="store",
+    )
+    parser.add_argument(
+        "--clear-cache",
+        help="Remove all files from the cache",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cache-budget",
+        help="Maximum size of the cache in GB, beyond which the least recently used files are removed",
+        action="store",
+        type=float,
+        required=False,
+    )
+    parser.add_argument(
+        "--single-pass",
+        help="Rasterize all features of a layer into one TIFF file, with a band per feature",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Amount of layers to rasterize in parallel",
+        action="store",
+        type=int,
+        required=False,
+        default=1,
+    )
+    parser.add_argument(
+        "--download-jobs",
+        help="Amount of BGT tiles to download at the same time",
+        action="store",
+        type=int,
+        required=False,
+        default=4,
+    )
+    parser.add_argument(
+        "--convert-bgt",
+        help="Convert the downloaded BGT data into linearized GeoPackages while extracting it",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--compact",
+        help="Use a compact memory layout for the grid, at the cost of float32 precision",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-name",
+        help="Name of the output file",
+        action="store",
+        required=False,
+        default="batch",
+    )
+    parser.add_argument(
+        "--padding",
+        help="Add padding to the grid around the corners of all pairs",
+        action="store",
+        type=float,
+        required=False,
+        default=0.1,
+    )
+    parser.add_argument(
+        "-c",
+        "--path-cost",
+        help="Cost of the path per meter of length",
+        action="store",
+        type=float,
+        required=False,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--resolution",
+        help="Resolution of the grid",
+        action="store",
+        type=float,
+        required=False,
+        default=1.0,
+    )
+    args = parser.parse_args()
+
+    if args.output_name == "":
+        print("Please provide an output name.")
+        exit(1)
+
+    if args.padding < 0.0:
+        print("Padding cannot be negative.")
+        exit(1)
+
+    if args.path_cost < 0.0:
+        print("Path cost cannot be negative.")  # To prevent negative weight cycles
+        exit(1)
+
+    if args.jobs < 1:
+        print("Must have at least one job.")
+        exit(1)
+
+    if args.download_jobs < 1:
+        print("Must have at least one download job.")
+        exit(1)
+
+    if args.cache_budget is not None and args.cache_budget < 0.0:
+        print("Cache budget cannot be negative.")
+        exit(1)
+
+    if args.resolution <= 0.0:
+        print("Resolution must be positive.")
+        exit(1)
+
+    return args
+
+
+def read_pairs(file_name: str) -> List[Pair]:
+    """
+    Read the pairs from a CSV or GEOJSON file.
+
+    A CSV file has a start_x, start_y, end_x and end_y column, and its other columns become feature properties.
+    A GEOJSON file has a feature per pair, with a LineString (or MultiPoint) geometry from the start to the end,
+    and its properties are kept.
+    """
+
+    pairs = []
+    if file_name.lower().endswith(".csv"):
+        with open(file_name, newline="") as f:
+            for row in csv.DictReader(f):
+                start = float(row.pop("start_x")), float(row.pop("start_y"))
+                end = float(row.pop("end_x")), float(row.pop("end_y"))
+                pairs.append((start, end, row))
+    else:
+        with open(file_name, "r") as f:
+            collection = json.load(f)
+        for feature in collection["features"]:
+            geometry = feature["geometry"]
+            if geometry["type"] not in ["LineString", "MultiPoint"]:
+                raise Exception(
+                    f"Pairs must be LineString or MultiPoint features, not {geometry['type']}"
+                )
+            coordinates = geometry["coordinates"]
+            start = float(coordinates[0][0]), float(coordinates[0][1])
+            end = float(coordinates[-1][0]), float(coordinates[-1][1])
+            pairs.append((start, end, dict(feature.get("properties") or {})))
+    return pairs
+
+
+def group_pairs(
+    pairs: List[Tuple[Tuple[int, int], Tuple[int, int]]],
+) -> Dict[Tuple[int, int], List[Tuple[int, Tuple[int, int], bool]]]:
+    """
+    Group the pairs of tiles by the tile their search starts from.
+
+    Since paths cost the same in both directions, a pair is searched from the end tile
+    if that tile occurs in more pairs than its start tile, so more pairs share a search.
+    Returns, for each tile to search from, the index, the other tile and whether it is reversed, of each pair.
+    """
+
+    counts = Counter(pos for pair in pairs for pos in set(pair))
+    groups = {}
+    for i, (from_pos, to_pos) in enumerate(pairs):
+        is_reversed = counts[to_pos] > counts[from_pos]
+        if is_reversed:
+            from_pos, to_pos = to_pos, from_pos
+        groups.setdefault(from_pos, []).append((i, to_pos, is_reversed))
+    return groups
+
+
+def main():
+    config = get_config()
+    args = get_args()
+
+    if args.clear_cache:
+        clear_cache()
+
+    pairs = read_pairs(args.pairs)
+    if len(pairs) == 0:
+        print("No pairs to find paths between.")
+        exit(1)
+    print(f"Read {len(pairs)} pairs")
+
+    # The grid covers the union of the bounding boxes of all pairs
+    xs = [x for start, end, _ in pairs for x, _ in [start, end]]
+    ys = [y for start, end, _ in pairs for _, y in [start, end]]
+    x_min, y_min = math.floor(min(xs)), math.floor(min(ys))
+    x_max, y_max = math.ceil(max(xs)), math.ceil(max(ys))
+    width_offset = int(args.padding * (x_max - x_min))
+    height_offset = int(args.padding * (y_max - y_min))
+
+    grid_x_min = x_min - width_offset
+    grid_y_min = y_min - height_offset
+    grid_x_max = x_max + width_offset + 1
+    grid_y_max = y_max + height_offset + 1
+    grid_height = grid_y_max - grid_y_min
+    wkt_rect = wkt_rect_from_corners((grid_x_min, grid_y_min), (grid_x_max, grid_y_max))
+
+    grid_zoomed_height = math.ceil(grid_height / args.resolution)
+    grid = load_grid(
+        wkt_rect,
+        (grid_x_min, grid_y_min, grid_x_max, grid_y_max),
+        args.resolution,
+        single_pass=args.single_pass,
+        jobs=args.jobs,
+        download_jobs=args.download_jobs,
+        convert_bgt=args.convert_bgt,
+        cache_budget=(
+            None if args.cache_budget is None else int(args.cache_budget * 1e9)
+        ),
+        compact=args.compact,
+    )
+    if grid is None:
+        return
+    c = grid.register_remaining_tiles(base_weight=config["unregistered_weight"])
+    print(f"{c} unregistered tiles")
+    geotransform = (
+        grid_x_min,
+        args.resolution,
+        0,
+        grid_y_min,
+        0,
+        args.resolution,
+        grid_zoomed_height,
+    )
+
+    def tile_of(x: float, y: float) -> Tuple[int, int]:
+        return (
+            int((x - grid_x_min) / args.resolution),
+            int((grid_y_max - 1 - y) / args.resolution),
+        )
+
+    groups = group_pairs([(tile_of(*start), tile_of(*end)) for start, end, _ in pairs])
+    print(f"Finding paths from {len(groups)} tiles..")
+
+    features = [None] * len(pairs)
+    for from_pos, group in groups.items():
+        to_positions = list(dict.fromkeys(to_pos for _, to_pos, _ in group))
+        found_paths = dict(
+            zip(
+                to_positions,
+                grid.find_paths(
+                    from_pos,
+                    to_positions,
+                    path_cost=args.path_cost * args.resolution,
+                    attribute_weights=config["attribute_weights"],
+                ),
+            )
+        )
+
+        indices = []
+        paths = []
+        properties = []
+        for i, to_pos, is_reversed in group:
+            path = found_paths[to_pos]
+            if path is None:
+                print(f"Could not find a path for pair {i + 1}")
+                continue
+            indices.append(i)
+            paths.append(path[::-1] if is_reversed else path)
+            properties.append(
+                {
+                    **pairs[i][2],
+                    "cost": float(grid.get_cost(to_pos)),
+                    "length": float(grid.get_path_length(to_pos)) * args.resolution,
+                }
+            )
+        # Features are created per search, as smoothing uses the costs of the search
+        group_features = Visualizer(paths, grid, geotransform).getFeatures(properties)
+        for i, feature in zip(indices, group_features):
+            features[i] = feature
+
+    print("Transforming paths to GEOJSON..")
+    Visualizer.writeGEOJSON(
+        [feature for feature in features if feature is not None], args.output_name
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
+from .cache_manifest import *
+from .coarse_to_fine import *
 from .grid import *
+from .hierarchical import *
+from .incremental import *
 from .layer import *
+from .parallel import *
 from .point import *
 from .rect import *
+from .search_state import *
 from .tiff_reader import *
+from .tiff_writer import *
 from .tile import *
 from .tile_attribute import *
 from .tile_data import *
@@ -0,0 +1,153 @@
+import json
+import os
+import sqlite3
+import time
+from typing import Iterable, List, Optional, Tuple
+
+
+class CacheManifest:
+    """
+    Keeps track of the cached files in an SQLite database, so the cache can be kept within a disk budget.
+
+    Every entry is a group of files that is only usable as a whole, such as a BGT tile and its extracted files.
+    It is identified by a key, which is the name of its main file.
+    For every entry the manifest records its size, the entries it was made from and when it was last used.
+    Files that are not recorded are never evicted.
+
+    Use it as a context manager, so the changes are committed and the database is closed afterwards.
+    """
+
+    _filename: str
+    _connection: Optional[sqlite3.Connection]
+
+    def __init__(self, filename: str):
+        """
+        Arguments:
+        filename: str -- the SQLite database of the manifest, which is created if it does not exist
+        """
+        self._filename = filename
+        self._connection = None
+
+    def __enter__(self) -> "CacheManifest":
+        self._connection = sqlite3.connect(self._filename)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                files TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS dependencies (
+                key TEXT NOT NULL,
+                dependency TEXT NOT NULL,
+                PRIMARY KEY (key, dependency)
+            );
+            """)
+        return self
+
+    def __exit__(self, *_) -> None:
+        if self._connection is not None:
+            self._connection.commit()
+            self._connection.close()
+            self._connection = None
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> sqlite3.Cursor:
+        if self._connection is None:
+            raise Exception("CacheManifest must be used as a context manager")
+        return self._connection.execute(sql, parameters)
+
+    def record(
+        self,
+        key: str,
+        files: Optional[List[str]] = None,
+        dependencies: Iterable[str] = (),
+    ) -> None:
+        """
+        Record that an entry was made or used just now, with the files it consists of and the entries it was made from.
+
+        The files default to just the key. Files that do not exist are left out.
+        """
+        files = [file for file in (files or [key]) if os.path.exists(file)]
+        size = sum(os.path.getsize(file) for file in files)
+        self._execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+            (key, json.dumps(files), size, time.time()),
+        )
+        self._execute("DELETE FROM dependencies WHERE key = ?", (key,))
+        for dependency in set(dependencies):
+            self._execute(
+                "INSERT INTO dependencies VALUES (?, ?)",
+                (key, dependency),
+            )
+
+    def touch(self, key: str) -> None:
+        """Record that an entry was used just now."""
+        self._execute(
+            "UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key)
+        )
+
+    def size(self) -> int:
+        """Get the size in bytes of all recorded entries."""
+        (size,) = self._execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return size
+
+    def dependencies(self, key: str) -> List[str]:
+        """Get the keys of the entries that the entry was made from."""
+        rows = self._execute(
+            "SELECT dependency FROM dependencies WHERE key = ?", (key,)
+        ).fetchall()
+        return [dependency for (dependency,) in rows]
+
+    def remove(self, key: str) -> None:
+        """Delete the files of an entry, and forget it."""
+        row = self._execute(
+            "SELECT files FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            for file in json.loads(row[0]):
+                if os.path.exists(file):
+                    os.remove(file)
+        self._execute("DELETE FROM entries WHERE key = ?", (key,))
+        # The entries made from this entry stay usable, since they do not read it anymore
+        self._execute(
+            "DELETE FROM dependencies WHERE key = ? OR dependency = ?", (key, key)
+        )
+
+    def remove_incomplete(self) -> int:
+        """
+        Remove the entries of which a file was deleted outside of the manifest, along with their other files.
+
+        Returns the amount of removed entries.
+        """
+        incomplete = [
+            key
+            for key, files in self._execute("SELECT key, files FROM entries").fetchall()
+            if not all(os.path.exists(file) for file in json.loads(files))
+        ]
+        for key in incomplete:
+            self.remove(key)
+        return len(incomplete)
+
+    def evict(self, budget: int, keep: Iterable[str] = ()) -> Tuple[int, int]:
+        """
+        Remove the least recently used entries until all entries together take at most `budget` bytes.
+
+        The entries in `keep` are never removed, even if the budget cannot be met without them.
+        Returns the amount of removed entries and the amount of bytes they took.
+        """
+        self.remove_incomplete()
+        keep = set(keep)
+        size = self.size()
+        removed, removed_size = 0, 0
+        for key, entry_size in self._execute(
+            "SELECT key, size FROM entries ORDER BY last_access"
+        ).fetchall():
+            if size <= budget:
+                break
+            if key in keep:
+                continue
+            self.remove(key)
+            size -= entry_size
+            removed += 1
+            removed_size += entry_size
+        return removed, removed_size
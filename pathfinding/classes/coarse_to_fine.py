@@ -0,0 +1,199 @@
+import numpy as np
+from typing import List, Optional, Set, Tuple
+
+from .grid import Grid
+
+
+class CorridorMask:
+    """
+    Mask of the tiles within a corridor of coarse tiles, which only stores the coarse tiles in the corridor.
+
+    Its memory use scales with the length of the corridor instead of with the grid area.
+    It can be used as mask of Grid.find_path, since it is indexed by (x, y) like a boolean array.
+    """
+
+    _coarse_tiles: Set[Tuple[int, int]]
+    _factor: int
+    _shape: Tuple[int, int]
+    _mask: Optional[np.ndarray]
+
+    def __init__(
+        self,
+        coarse_tiles: Set[Tuple[int, int]],
+        factor: int,
+        shape: Tuple[int, int],
+        mask: Optional[np.ndarray] = None,
+    ):
+        """
+        Arguments:
+        coarse_tiles: Set[Tuple[int, int]] -- the coarse tiles in the corridor
+        factor: int -- how many tiles a coarse tile is wide (and high)
+        shape: Tuple[int, int] -- the dimensions of the grid at full resolution
+
+        Optional arguments:
+        mask: np.ndarray -- only include the tiles of the corridor for which this mask is set as well, default None
+        """
+        self._coarse_tiles = coarse_tiles
+        self._factor = factor
+        self._shape = shape
+        self._mask = mask
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self._shape
+
+    def __getitem__(self, pos: Tuple[int, int]) -> bool:
+        x, y = pos
+        return (x // self._factor, y // self._factor) in self._coarse_tiles and (
+            self._mask is None or bool(self._mask[x, y])
+        )
+
+
+class CoarseToFineGrid:
+    """
+    Multi-resolution path finding on top of a grid.
+
+    Paths are first found on a downsampled copy of the grid.
+    The coarse path is widened into a corridor, to which the search at full resolution is limited,
+    so the time (and, with a sparse search state, the memory) of that search scale with the path length
+    instead of with the grid area.
+    """
+
+    _grid: Grid
+    _factor: int
+    _pooling: str
+    _corridor_radius: int
+    _coarse_grid: Optional[Grid]
+    _fell_back: bool
+
+    def __init__(
+        self, grid: Grid, factor: int, pooling: str = "mean", corridor_radius: int = 1
+    ):
+        """
+        Arguments:
+        grid: Grid -- the grid to find paths on
+        factor: int -- how many tiles of the grid a coarse tile is wide (and high)
+
+        Optional arguments:
+        pooling: str -- how the weights of coarse tiles are computed, "min" or "mean", default "mean"
+        corridor_radius: int -- how many coarse tiles the corridor stretches on each side of the coarse path, default 1
+        """
+        if factor < 2:
+            raise Exception("Coarse tiles must be at least 2 tiles wide")
+        if corridor_radius < 0:
+            raise Exception("Corridor radius cannot be negative")
+        self._grid = grid
+        self._factor = factor
+        self._pooling = pooling
+        self._corridor_radius = corridor_radius
+        self._coarse_grid = None
+        self._fell_back = False
+
+    @property
+    def grid(self) -> Grid:
+        """Get the underlying grid."""
+        return self._grid
+
+    @property
+    def coarse_grid(self) -> Optional[Grid]:
+        """Get the coarse grid used by the last path finding computation."""
+        return self._coarse_grid
+
+    @property
+    def fell_back(self) -> bool:
+        """Check if the last path finding computation had to search the whole grid, because no path was found within the corridor."""
+        return self._fell_back
+
+    def find_path(
+        self,
+        from_pos: Tuple[int, int],
+        to_pos: Tuple[int, int],
+        max_length=None,
+        path_cost=0,
+        attribute_weights=None,
+        existing_paths=None,
+        existing_path_multiplier=1,
+        existing_path_radius=0,
+        bidirectional=False,
+        verify_heuristic=False,
+        mask=None,
+    ) -> Optional[List[Tuple[int, int]]]:
+        """
+        Find a path like Grid.find_path does, with the search limited to a corridor around the coarse path.
+
+        The path is usually close to, but not always as cheap as, the path found by Grid.find_path.
+        If the corridor does not connect the start and end at full resolution, or no path within it is short enough,
+        the whole grid is searched instead, which is reported and can be checked with fell_back.
+        Afterwards, the grid holds the search state of the path, like after Grid.find_path.
+        If no path can be found, it returns None.
+
+        The coarse search does not take the mask into account, only the search at full resolution does.
+
+        Takes the same optional arguments as Grid.find_path.
+        """
+        grid = self._grid
+        grid.init_weights(
+            attribute_weights,
+            existing_paths,
+            existing_path_multiplier,
+            existing_path_radius,
+        )
+
+        self._coarse_grid = grid.downsample(self._factor, self._pooling)
+        coarse_path = self._coarse_grid.find_path(
+            (from_pos[0] // self._factor, from_pos[1] // self._factor),
+            (to_pos[0] // self._factor, to_pos[1] // self._factor),
+            path_cost=path_cost,
+            bidirectional=bidirectional,
+        )
+        if coarse_path is None:
+            # Tiles that are connected at full resolution are connected in the coarse grid as well
+            return None
+
+        if mask is not None and not isinstance(mask, np.ndarray):
+            mask = grid.polygon_mask(mask)
+        path = grid.find_path(
+            from_pos,
+            to_pos,
+            max_length=max_length,
+            path_cost=path_cost,
+            bidirectional=bidirectional,
+            verify_heuristic=verify_heuristic,
+            mask=self._corridor(coarse_path, mask),
+        )
+        self._fell_back = path is None
+        if path is None:
+            print("No path found within the corridor, searching the whole grid..")
+            path = grid.find_path(
+                from_pos,
+                to_pos,
+                max_length=max_length,
+                path_cost=path_cost,
+                bidirectional=bidirectional,
+                verify_heuristic=verify_heuristic,
+                mask=mask,
+            )
+        return path
+
+    def _corridor(
+        self, coarse_path: List[Tuple[int, int]], mask: Optional[np.ndarray]
+    ) -> CorridorMask:
+        # Get a mask of the tiles covered by the coarse path, widened by the corridor radius, and within the mask.
+        coarse_dimensions = self._coarse_grid.dimensions
+        r = self._corridor_radius
+        coarse_tiles = {
+            (x, y)
+            for path_x, path_y in coarse_path
+            for x in range(
+                max(path_x - r, 0), min(path_x + r + 1, coarse_dimensions.width)
+            )
+            for y in range(
+                max(path_y - r, 0), min(path_y + r + 1, coarse_dimensions.height)
+            )
+        }
+        return CorridorMask(
+            coarse_tiles,
+            self._factor,
+            (self._grid.dimensions.width, self._grid.dimensions.height),
+            mask,
+        )
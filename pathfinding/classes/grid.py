@@ -1,7 +1,10 @@
+import heapq
+import os
 import numpy as np
-from queue import PriorityQueue
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 import math
+from matplotlib.path import Path
+from scipy.ndimage import distance_transform_edt
 
 from .point import Point
 from .rect import Rect
@@ -9,9 +12,17 @@ from .tile import Tile
 from .tile_attribute import TileAttribute
 from .tile_data import TileData
 from ..helpers.math import lerp
+from .search_state import (
+    INVALID_PARENT,
+    DenseSearchState,
+    SearchState,
+    SparseSearchState,
+)
 from .visit_state import VisitState
 
-INVALID_PARENT = (-1, -1)
+
+# Path lengths are sums of step lengths, so they are compared to the maximum length with some tolerance
+LENGTH_TOLERANCE = 1e-9
 
 
 def dist(from_pos: Tuple[int, int], to_pos: Tuple[int, int]) -> float:
@@ -25,85 +36,187 @@ class Grid:
     """Information of a grid of tiles useable for path finding."""
 
     _dimensions: Rect
+    _compact: bool
     _weights: np.ndarray
-    _base_weights: np.ndarray
-    _visit_states: np.ndarray
-    _parents: np.ndarray
-    _costs: np.ndarray
-    _heuristics: np.ndarray
-    _path_lengths: np.ndarray
+    _base_weights: Optional[np.ndarray]
+    _remaining_base_weight: float
+    _sparse_search: bool
+    _search: SearchState
+    _backward_search: Optional[SearchState]
+    _min_weight: float
+    _min_weight_outdated: bool
+    _mask: Optional[np.ndarray]
     _attributes: np.ndarray
     _registered: np.ndarray
     _path_finding_has_run: bool
+    _cache_key: Optional[str]
+    _unregistered_weight: Optional[float]
+
+    def __init__(
+        self, dimensions: Rect, compact: bool = False, sparse_search: bool = False
+    ):
+        """
+        Optional arguments:
+        compact: bool -- use a compact memory layout, default False
+        sparse_search: bool -- keep the search state in dictionaries instead of arrays, default False
 
-    def __init__(self, dimensions: Rect):
+        A compact grid stores weights and costs as float32 and parents as a direction code.
+        Heuristics and path lengths are not stored, unless they are explicitly set.
+        Base weights are derived from the attributes, for as long as that is possible:
+        tiles with attributes have a base weight of 0, and all registered tiles without attributes share one base weight.
+
+        The search state (visit states, parents, costs, heuristics and path lengths) is kept apart from the grid.
+        It is allocated on first use, and resetting it does not take time proportional to the grid area.
+        A sparse search state also uses memory proportional to the amount of touched tiles only.
+        """
         self._dimensions = dimensions
+        self._compact = compact
         shape = (dimensions.width, dimensions.height)
-        self._weights = np.zeros(shape, dtype=np.float_)
-        self._base_weights = np.zeros(shape, dtype=np.float_)
-        self._visit_states = np.zeros(shape, dtype=np.int8)
-        self._parents = np.empty(shape, dtype=(np.int_, 2))
-        self._parents[...] = INVALID_PARENT
-        self._costs = np.zeros(shape, dtype=np.float_)
-        self._heuristics = np.zeros(shape, dtype=np.float_)
-        self._path_lengths = np.zeros(shape, dtype=np.float_)
+        float_type = np.float32 if compact else np.float_
+        self._weights = np.zeros(shape, dtype=float_type)
+        self._base_weights = None if compact else np.zeros(shape, dtype=float_type)
+        self._remaining_base_weight = 0
+        self._sparse_search = sparse_search
+        self._search = self._create_search_state()
+        self._backward_search = None
+        self._min_weight = 0
+        self._min_weight_outdated = True
+        self._mask = None
         self._attributes = np.zeros(shape, dtype=np.int64)
         self._registered = np.zeros(shape, dtype=np.bool_)
         self._path_finding_has_run = False
+        self._cache_key = None
+        self._unregistered_weight = None
 
     @property
     def dimensions(self) -> Rect:
         """Get the dimensions of the grid."""
         return self._dimensions
 
+    @property
+    def cache_key(self) -> Optional[str]:
+        """
+        Get the key that the grid was saved or loaded with, or None if it was not.
+
+        The key identifies the tiles that were registered when the grid was saved,
+        but not the tiles registered afterwards, such as with register_remaining_tiles.
+        """
+        return self._cache_key
+
+    @property
+    def unregistered_weight(self) -> Optional[float]:
+        """
+        Get the base weight that register_remaining_tiles registered tiles with, or None if it registered none.
+
+        Together with the cache key, it identifies the base weights of a loaded grid.
+        """
+        return self._unregistered_weight
+
+    def _create_search_state(self) -> SearchState:
+        # Create an empty search state that fits the grid.
+        if self._sparse_search:
+            return SparseSearchState()
+        return DenseSearchState(
+            (self.dimensions.width, self.dimensions.height), compact=self._compact
+        )
+
     def get_cost(self, pos: Tuple[int, int]) -> float:
-        return self._costs[pos]
+        return self._search.get_cost(pos)
 
     def set_cost(self, pos: Tuple[int, int], value: float):
-        self._costs[pos] = value
+        self._search.set_cost(pos, value)
+
+    @property
+    def compact(self) -> bool:
+        """Check if the grid uses the compact memory layout."""
+        return self._compact
+
+    def bytes_per_tile(self) -> float:
+        """Get the amount of memory used by the grid's arrays and search state, per tile."""
+        nbytes = sum(
+            value.nbytes
+            for value in vars(self).values()
+            if isinstance(value, np.ndarray)
+        )
+        nbytes += self._search.nbytes()
+        if self._backward_search is not None:
+            nbytes += self._backward_search.nbytes()
+        return nbytes / (self.dimensions.width * self.dimensions.height)
 
     def get_base_weight(self, pos: Tuple[int, int]) -> float:
+        if self._base_weights is None:
+            if self._registered[pos] and self._attributes[pos] == 0:
+                return self._remaining_base_weight
+            return 0
         return self._base_weights[pos]
 
     def set_base_weight(self, pos: Tuple[int, int], value: float):
+        if self._base_weights is None:
+            if value == self.get_base_weight(pos):
+                return
+            self._store_base_weights()
         self._base_weights[pos] = value
 
+    def _get_base_weights(self) -> np.ndarray:
+        # Get the base weights of all tiles, deriving them from the attributes if they are not stored.
+        if self._base_weights is not None:
+            return self._base_weights
+        base_weights = np.zeros(self._attributes.shape, dtype=self._weights.dtype)
+        if self._remaining_base_weight != 0:
+            base_weights[self._registered & (self._attributes == 0)] = (
+                self._remaining_base_weight
+            )
+        return base_weights
+
+    def _store_base_weights(self) -> None:
+        # Start storing the base weights, because they can no longer be derived from the attributes.
+        if self._base_weights is None:
+            self._base_weights = self._get_base_weights()
+
     def get_weight(self, pos: Tuple[int, int]) -> float:
         return self._weights[pos]
 
     def set_weight(self, pos: Tuple[int, int], value: float):
         self._weights[pos] = value
+        self._min_weight_outdated = True
 
     def get_heuristic(self, pos: Tuple[int, int]) -> float:
-        return self._heuristics[pos]
+        return self._search.get_heuristic(pos)
 
     def set_heuristic(self, pos: Tuple[int, int], value: float):
-        self._heuristics[pos] = value
+        self._search.set_heuristic(pos, value)
 
     def get_parent(self, pos: Tuple[int, int]) -> Tuple[int, int]:
-        p = self._parents[pos]
-        return (p[0], p[1])
+        return self._search.get_parent(pos)
 
     def set_parent(self, pos: Tuple[int, int], value: Tuple[int, int]):
-        self._parents[pos] = value
+        self._search.set_parent(pos, value)
 
     def get_path_length(self, pos: Tuple[int, int]) -> float:
-        return self._path_lengths[pos]
+        return self._search.get_path_length(pos)
 
     def set_path_length(self, pos: Tuple[int, int], value: float):
-        self._path_lengths[pos] = value
+        self._search.set_path_length(pos, value)
 
     def get_visit_state(self, pos: Tuple[int, int]) -> VisitState:
-        return VisitState(self._visit_states[pos])
+        return self._search.get_visit_state(pos)
 
     def set_visit_state(self, pos: Tuple[int, int], value: VisitState):
-        self._visit_states[pos] = value.value
+        self._search.set_visit_state(pos, value)
+
+    def visited_count(self) -> int:
+        """Get the amount of tiles visited by the last path finding computation."""
+        count = self._search.visited_count()
+        if self._backward_search is not None:
+            count += self._backward_search.visited_count()
+        return count
 
     def get_registered(self, pos: Tuple[int, int]) -> bool:
         return self._registered[pos]
 
     def set_registered(self, pos: Tuple[int, int], value: bool):
         self._registered[pos] = value
+        self._min_weight_outdated = True
 
     def get_attribute(self, pos: Tuple[int, int], attr: TileAttribute) -> bool:
         return bool(self._attributes[pos] & (1 << int(attr)))
@@ -119,11 +232,163 @@ class Grid:
         attributes: List[TileAttribute] = [],
     ) -> None:
         """Register the tile with the given tile data."""
-        self.set_registered(pos, True)
-        self.set_base_weight(pos, base_weight)
-        self.set_weight(pos, base_weight)
+        self.register_tiles(
+            np.ones((1, 1), dtype=np.bool_),
+            base_weight=base_weight,
+            attributes=attributes,
+            offset=pos,
+        )
+
+    def register_tiles(
+        self,
+        mask: np.ndarray,
+        base_weight: float = 0,
+        attributes: List[TileAttribute] = [],
+        offset: Tuple[int, int] = (0, 0),
+    ) -> None:
+        """
+        Register all tiles for which the mask is set, like register_tile_at does for a single tile.
+
+        The mask is indexed by (x, y) like the grid itself.
+        It may be smaller than the grid, in which case it covers the grid from the given offset.
+        Parts of the mask that fall outside the grid are ignored.
+        """
+        x, y = offset
+        mask = mask[
+            : max(self.dimensions.width - x, 0), : max(self.dimensions.height - y, 0)
+        ]
+        region = (slice(x, x + mask.shape[0]), slice(y, y + mask.shape[1]))
+        bits = 0
         for attribute in attributes:
-            self.set_attribute(pos, attribute, True)
+            bits |= 1 << int(attribute)
+
+        if self._base_weights is None:
+            if bits:
+                # Tiles with attributes have a derived base weight of 0
+                derivable = base_weight == 0
+            else:
+                # Registered tiles without attributes share one derived base weight
+                derivable = not self._attributes[region][mask].any() and (
+                    base_weight == self._remaining_base_weight
+                    or not (self._registered & (self._attributes == 0)).any()
+                )
+            if derivable and not bits:
+                self._remaining_base_weight = base_weight
+            elif not derivable:
+                self._store_base_weights()
+
+        self._registered[region][mask] = True
+        if self._base_weights is not None:
+            self._base_weights[region][mask] = base_weight
+        self._weights[region][mask] = base_weight
+        self._min_weight_outdated = True
+        if bits:
+            self._attributes[region][mask] |= bits
+
+    def register_remaining_tiles(self, base_weight: float = 0) -> int:
+        """Register all tiles that are not registered yet, and return how many there were."""
+        unregistered = ~self._registered
+        self.register_tiles(unregistered, base_weight=base_weight)
+        count = int(np.count_nonzero(unregistered))
+        if count > 0:
+            self._unregistered_weight = float(base_weight)
+        return count
+
+    def save(self, directory: str, key: str) -> None:
+        """
+        Save the attributes and registration of all tiles as uncompressed .npy files.
+
+        Weights are not saved, so this must be called before registering the remaining tiles,
+        while all registered tiles still have a base weight of 0.
+        """
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        for name, array in [
+            ("attributes", self._attributes),
+            ("registered", self._registered),
+        ]:
+            filename = os.path.join(directory, f"{key}_{name}.npy")
+            # Write to a temporary file first, so an interrupted run leaves no partial cache behind
+            with open(f"{filename}.tmp", "wb") as file:
+                np.save(file, array)
+            os.replace(f"{filename}.tmp", filename)
+        self._cache_key = key
+
+    @classmethod
+    def load(
+        cls,
+        directory: str,
+        key: str,
+        compact: bool = False,
+        sparse_search: bool = False,
+    ) -> Optional["Grid"]:
+        """
+        Load a grid saved with save(), or return None if it is not cached.
+
+        The attributes are memory-mapped read-only, so only the parts that are used get read from disk.
+        The registration is memory-mapped copy-on-write, so the remaining tiles can still be registered.
+        """
+        attributes_filename = os.path.join(directory, f"{key}_attributes.npy")
+        registered_filename = os.path.join(directory, f"{key}_registered.npy")
+        if not (
+            os.path.exists(attributes_filename) and os.path.exists(registered_filename)
+        ):
+            return None
+
+        attributes = np.load(attributes_filename, mmap_mode="r")
+        registered = np.load(registered_filename, mmap_mode="c")
+        grid = cls(
+            Rect(attributes.shape[0], attributes.shape[1]),
+            compact=compact,
+            sparse_search=sparse_search,
+        )
+        grid._attributes = attributes
+        grid._registered = registered
+        grid._cache_key = key
+        return grid
+
+    def downsample(self, factor: int, pooling: str = "mean") -> "Grid":
+        """
+        Create a coarser grid, of which every tile covers factor by factor tiles of this grid.
+
+        A coarse tile is registered if any of the tiles it covers are registered.
+        Its weight (and base weight) is the minimum or mean of the weights of those registered tiles,
+        depending on the pooling, which is either "min" or "mean".
+        The coarse grid has no attributes, and uses the same memory layout and search state as this grid.
+        """
+        if factor < 1:
+            raise Exception("Cannot downsample by a factor of less than 1")
+        if pooling not in ["min", "mean"]:
+            raise Exception(f"Unknown pooling {pooling}")
+
+        width = math.ceil(self.dimensions.width / factor)
+        height = math.ceil(self.dimensions.height / factor)
+        # Pad the arrays to a multiple of the factor, and split them into blocks
+        padded_shape = (width * factor, height * factor)
+        region = (slice(0, self.dimensions.width), slice(0, self.dimensions.height))
+        registered = np.zeros(padded_shape, dtype=np.bool_)
+        registered[region] = self._registered
+        registered = registered.reshape(width, factor, height, factor)
+        weights = np.zeros(padded_shape, dtype=self._weights.dtype)
+        weights[region] = self._weights
+        weights = weights.reshape(width, factor, height, factor)
+
+        coarse = Grid(
+            Rect(width, height),
+            compact=self._compact,
+            sparse_search=self._sparse_search,
+        )
+        coarse._registered = registered.any(axis=(1, 3))
+        if pooling == "min":
+            pooled = np.where(registered, weights, np.inf).min(axis=(1, 3))
+        else:
+            pooled = np.where(registered, weights, 0).sum(axis=(1, 3)) / np.maximum(
+                registered.sum(axis=(1, 3)), 1
+            )
+        pooled[~coarse._registered] = 0
+        coarse._weights = pooled.astype(self._weights.dtype)
+        coarse._base_weights = coarse._weights.copy()
+        return coarse
 
     def deregister_tile_at(self, pos: Tuple[int, int]) -> None:
         """Deregister the tile by removing its tile data."""
@@ -131,33 +396,84 @@ class Grid:
 
     def reset(self) -> None:
         """Reset the grid, so it can be used in another path finding computation."""
-        self._parents[...] = INVALID_PARENT
-        self._costs[...] = 0
-        self._heuristics[...] = 0
-        self._path_lengths[...] = 0
-        self._visit_states[...] = VisitState.Undiscovered.value
+        self._search.reset()
+        if self._backward_search is not None:
+            self._backward_search.reset()
         self._path_finding_has_run = False
 
-    def _undiscover_all(self) -> None:
-        # Reset all tiles' visited states to Undiscovered.
-        self._visit_states[...] = VisitState.Undiscovered.value
-
     def _neighbours_of(self, pos: Tuple[int, int]) -> List[Tuple[int, int]]:
         # Get the up to 8 neighbours of the given tile.
-        # Unregistered tiles do not count.
+        # Unregistered tiles do not count, and neither do tiles outside the mask of the search.
         return [
             (x, y)
             for x in range(max(pos[0] - 1, 0), min(pos[0] + 2, self.dimensions.width))
             for y in range(max(pos[1] - 1, 0), min(pos[1] + 2, self.dimensions.height))
-            if self._registered[x, y] and (x, y) != pos
+            if self._registered[x, y]
+            and (self._mask is None or self._mask[x, y])
+            and (x, y) != pos
         ]
 
+    def _can_enter(self, pos: Tuple[int, int]) -> bool:
+        # Check if a search can step onto the tile, like _neighbours_of does
+        return bool(self._registered[pos]) and (self._mask is None or self._mask[pos])
+
+    def polygon_mask(self, vertices: List[Tuple[float, float]]) -> np.ndarray:
+        """
+        Get a mask of the tiles that lie within the polygon with the given vertices.
+
+        The vertices are in tile coordinates, so a tile lies within the polygon if its position does.
+        Tiles exactly on the edge of the polygon may fall either way.
+        """
+        mask = np.zeros((self.dimensions.width, self.dimensions.height), dtype=np.bool_)
+        xs, ys = zip(*vertices)
+        # Only test the tiles within the bounding box of the polygon
+        x_min, x_max = max(math.floor(min(xs)), 0), min(
+            math.ceil(max(xs)) + 1, self.dimensions.width
+        )
+        y_min, y_max = max(math.floor(min(ys)), 0), min(
+            math.ceil(max(ys)) + 1, self.dimensions.height
+        )
+        if x_min >= x_max or y_min >= y_max:
+            return mask
+        x, y = np.meshgrid(
+            np.arange(x_min, x_max), np.arange(y_min, y_max), indexing="ij"
+        )
+        inside = Path(vertices).contains_points(np.column_stack([x.ravel(), y.ravel()]))
+        mask[x_min:x_max, y_min:y_max] = inside.reshape(x.shape)
+        return mask
+
     def _heuristic_of(
         self, from_pos: Tuple[int, int], to_pos: Tuple[int, int], path_cost: float
     ) -> float:
         # Get the A* heuristic for a tile.
         # Uses the given end tile for A* to calculate the heuristic with.
-        return path_cost * dist(from_pos, to_pos)
+        # Every step costs at least the minimum weight plus its length times the path cost,
+        # and a path takes at least as many steps as the Chebyshev distance.
+        steps = max(abs(from_pos[0] - to_pos[0]), abs(from_pos[1] - to_pos[1]))
+        return steps * self._min_weight + path_cost * dist(from_pos, to_pos)
+
+    def _update_min_weight(self) -> None:
+        # Store the minimum weight of the registered tiles, used by the heuristic.
+        # Negative weights make the heuristic fall back to the path cost only.
+        # Only called when the weights or registration changed, since it takes time proportional to the grid area.
+        min_weight = float(
+            np.min(self._weights, where=self._registered, initial=np.inf)
+        )
+        self._min_weight = max(min_weight, 0) if min_weight < np.inf else 0
+        self._min_weight_outdated = False
+
+    def _verify_heuristic(self, path: List[Tuple[int, int]], path_cost: float) -> None:
+        # Check that the heuristic towards the end of the path does not exceed the remaining cost of any tile on it.
+        # Costs are compared with some tolerance, as they may be stored with float32 precision.
+        to_pos = path[-1]
+        total_cost = float(self.get_cost(to_pos))
+        for pos in path:
+            heuristic = self._heuristic_of(pos, to_pos, path_cost)
+            remaining_cost = total_cost - float(self.get_cost(pos))
+            if heuristic > remaining_cost + 1e-6 * max(abs(total_cost), 1):
+                raise Exception(
+                    f"Heuristic of {heuristic} at {pos} exceeds the remaining cost of {remaining_cost}"
+                )
 
     def path_to(self, pos: Tuple[int, int]) -> List[Tuple[int, int]]:
         """
@@ -166,11 +482,70 @@ class Grid:
         """
         if not self._path_finding_has_run:
             raise Exception("Must run A* before getting a tile's path")
-        path = [pos]
-        while not np.array_equal((pos := self.get_parent(pos)), INVALID_PARENT):
-            path += [pos]
-        path.reverse()
-        return path
+        return self._search.path_to(pos)
+
+    def init_weights(
+        self,
+        attribute_weights=None,
+        existing_paths=None,
+        existing_path_multiplier=1,
+        existing_path_radius=0,
+    ) -> None:
+        """
+        Set the weights of all tiles from their attributes and the existing paths.
+
+        Called by find_path, with the optional arguments of the same name.
+        If attribute_weights is None, the current weights are corrected to the existing paths instead.
+        """
+
+        # Correct weights to attributes
+        if attribute_weights is not None:
+            self._init_weights_from_attributes(attribute_weights)
+
+        # Corrects weights to existing_paths
+        if existing_paths is not None:
+            if existing_path_multiplier < 1:
+                raise Exception(
+                    "An existing path multiplier of less than 1 makes no sense"
+                )
+            if existing_path_multiplier > 1 and len(existing_paths) > 0:
+                self._correct_weights_to_paths(
+                    existing_paths, existing_path_multiplier, existing_path_radius
+                )
+
+        if self._min_weight_outdated:
+            self._update_min_weight()
+
+    def _prepare_search(
+        self,
+        attribute_weights,
+        existing_paths,
+        existing_path_multiplier,
+        existing_path_radius,
+        mask,
+    ) -> None:
+        # Reset the search state, and set the weights and mask for the next search.
+        # Masks are indexed by (x, y) and have a shape, like boolean arrays and CorridorMask; polygons do not
+        if mask is not None and not hasattr(mask, "shape"):
+            mask = self.polygon_mask(mask)
+        if mask is not None and mask.shape != (
+            self.dimensions.width,
+            self.dimensions.height,
+        ):
+            raise Exception("The mask must have the same dimensions as the grid")
+
+        # Cleanup to prepare for running the algorithm
+        if self._path_finding_has_run:
+            self.reset()
+        self._path_finding_has_run = True
+
+        self.init_weights(
+            attribute_weights,
+            existing_paths,
+            existing_path_multiplier,
+            existing_path_radius,
+        )
+        self._mask = mask
 
     def find_path(
         self,
@@ -182,6 +557,9 @@ class Grid:
         existing_paths=None,
         existing_path_multiplier=1,
         existing_path_radius=0,
+        bidirectional=False,
+        verify_heuristic=False,
+        mask=None,
     ) -> Optional[List[Tuple[int, int]]]:
         """
         Run A* on the grid.
@@ -197,148 +575,523 @@ class Grid:
         existing_path_multiplier: float -- how much more existing paths should be weighted (diminishes linearly with distance), default 1
         existing_path_radius: int -- how many tiles the existing paths stretch for purpose of weight multiplication, default 0
         attribute_weights: Dict[TileAttribute, float] -- weights for each TileAttribute, default 0
+        bidirectional: bool -- search from both ends at once until the searches meet, default False
+        verify_heuristic: bool -- check that the heuristic never overestimates the cost along the found path, default False
+        mask: np.ndarray | CorridorMask | List[Tuple[float, float]] -- only search the tiles for which this mask is set, or the tiles within this polygon (see polygon_mask), default None
+
+        Bidirectional search cannot be combined with max_length.
         """
 
-        # Cleanup to prepare for running the algorithm
-        if self._path_finding_has_run:
-            self.reset()
-        self._path_finding_has_run = True
+        if bidirectional and max_length is not None:
+            raise Exception("Bidirectional search does not support a maximum length")
 
-        # Correct weights to attributes
-        if attribute_weights is not None:
-            self._init_weights_from_attributes(attribute_weights)
+        self._prepare_search(
+            attribute_weights,
+            existing_paths,
+            existing_path_multiplier,
+            existing_path_radius,
+            mask,
+        )
 
-        # Corrects weights to existing_paths
-        if existing_paths is not None:
-            if existing_path_multiplier < 1:
-                raise Exception(
-                    "An existing path multiplier of less than 1 makes no sense"
-                )
-            if existing_path_multiplier > 1 and len(existing_paths) > 0:
-                self._correct_weights_to_paths(
-                    existing_paths, existing_path_multiplier, existing_path_radius
+        if bidirectional:
+            path = self._find_path_bidirectional(from_pos, to_pos, path_cost)
+        elif max_length is not None:
+            # The cheapest path is the answer if it is short enough, and it is much quicker to find
+            path = self._find_path_unidirectional(from_pos, to_pos, path_cost)
+            if (
+                path is not None
+                and self.get_path_length(to_pos) > max_length + LENGTH_TOLERANCE
+            ):
+                self._search.reset()
+                path = self._find_path_constrained(
+                    from_pos, to_pos, max_length, path_cost
                 )
+        else:
+            path = self._find_path_unidirectional(from_pos, to_pos, path_cost)
+        if path is not None and verify_heuristic:
+            self._verify_heuristic(path, path_cost)
+        return path
 
-        # Initialisation of A*
-        to_visit = (
-            PriorityQueue()
-        )  # to_visit is a queue of (cost with heuristic, cost without heuristic, tile)
-        self.set_cost(from_pos, 0)
-        self.set_path_length(from_pos, 0)
-        to_visit.put(
-            (
-                self.get_cost(from_pos)
-                + self._heuristic_of(from_pos, to_pos, path_cost),
-                self.get_cost(from_pos),
-                from_pos,
-            )
+    def find_paths(
+        self,
+        from_pos: Tuple[int, int],
+        to_positions: List[Tuple[int, int]],
+        path_cost=0,
+        attribute_weights=None,
+        existing_paths=None,
+        existing_path_multiplier=1,
+        existing_path_radius=0,
+        mask=None,
+    ) -> List[Optional[List[Tuple[int, int]]]]:
+        """
+        Run Dijkstra on the grid, from one start tile until all given end tiles are reached.
+
+        All paths come from the same search, which is much quicker than finding each path separately.
+        Calls reset() beforehand if needed.
+        Returns the path to each end tile, in the same order, or None for end tiles that cannot be reached.
+        Afterwards, the grid holds the search state of all paths, like after find_path.
+
+        Takes the same optional arguments as find_path.
+        """
+
+        self._prepare_search(
+            attribute_weights,
+            existing_paths,
+            existing_path_multiplier,
+            existing_path_radius,
+            mask,
+        )
+
+        if len(to_positions) == 1:
+            # With a single end tile, the heuristic can guide the search
+            self._search_from(from_pos, set(to_positions), path_cost, to_positions[0])
+        else:
+            self._search_from(from_pos, set(to_positions), path_cost)
+        return [
+            self.path_to(to_pos)
+            if self.get_visit_state(to_pos) == VisitState.Visited
+            else None
+            for to_pos in to_positions
+        ]
+
+    def find_costs(
+        self,
+        from_pos: Tuple[int, int],
+        max_cost=None,
+        path_cost=0,
+        attribute_weights=None,
+        existing_paths=None,
+        existing_path_multiplier=1,
+        existing_path_radius=0,
+        mask=None,
+    ) -> int:
+        """
+        Run Dijkstra on the grid from one start tile, without an end tile.
+
+        The search goes on until all reachable tiles are visited, or until the costs exceed max_cost.
+        Afterwards, every visited tile holds its cost and parent, so the path to it can be traced back
+        with path_to, and get_cost_surface returns them for all tiles at once.
+        Calls reset() beforehand if needed.
+        Returns the amount of visited tiles.
+
+        Optional arguments:
+        max_cost: float -- stop once the cheapest tile left costs more than this, default None
+
+        Takes the same other optional arguments as find_path.
+        """
+
+        self._prepare_search(
+            attribute_weights,
+            existing_paths,
+            existing_path_multiplier,
+            existing_path_radius,
+            mask,
+        )
+        self._search_from(
+            from_pos,
+            set(),
+            path_cost,
+            max_cost=math.inf if max_cost is None else max_cost,
         )
+        return self.visited_count()
+
+    def get_cost_surface(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the costs and parent directions of all tiles, as arrays indexed by (x, y).
+
+        Tiles that were not visited by the last search have a NaN cost and no parent direction.
+        See trace_path for the encoding of the parent directions.
+        """
+        return self._search.to_arrays((self.dimensions.width, self.dimensions.height))
+
+    def _find_path_unidirectional(
+        self,
+        from_pos: Tuple[int, int],
+        to_pos: Tuple[int, int],
+        path_cost: float,
+    ) -> Optional[List[Tuple[int, int]]]:
+        # Run A* from the start to the end.
+        if not self._search_from(from_pos, {to_pos}, path_cost, to_pos):
+            return None
+        return self.path_to(to_pos)
+
+    def _search_from(
+        self,
+        from_pos: Tuple[int, int],
+        to_positions: Set[Tuple[int, int]],
+        path_cost: float,
+        heuristic_pos: Optional[Tuple[int, int]] = None,
+        max_cost: float = math.inf,
+    ) -> bool:
+        # Run A* (or Dijkstra, without a heuristic tile) from the start until all end tiles are visited,
+        # or until the cheapest tile left costs more than max_cost.
+        # Returns whether all end tiles could be reached.
+        to_positions = set(to_positions)
+
+        # Initialisation of A*
+        # to_visit is a binary heap of (cost with heuristic, cost without heuristic, tile).
+        # Instead of updating entries in place, improved costs are pushed as new entries;
+        # stale entries are recognised on pop by comparing them against the stored costs.
+        to_visit = []
+        # The search state is used directly, as going through the grid's accessors slows down the main loop
+        search = self._search
+        weights = self._weights
+        # Compact grids only store path lengths if they are needed
+        track_lengths = search.stores_path_lengths()
+        search.set_visit_state(from_pos, VisitState.Discovered)
+        search.set_cost(from_pos, 0)
+        if track_lengths:
+            search.set_path_length(from_pos, 0)
+        from_full_cost = 0.0
+        if heuristic_pos is not None:
+            from_full_cost += self._heuristic_of(from_pos, heuristic_pos, path_cost)
+        heapq.heappush(to_visit, (from_full_cost, 0.0, from_pos))
 
         # Main A* loop
-        while len(to_visit.queue) > 0:
+        while len(to_visit) > 0:
             # Visit next tile
-            s_full_cost, s_cost, s_pos = to_visit.get()
-            if self.get_visit_state(s_pos) == VisitState.Visited or (
-                # A more efficient option could be:
-                # check if the current length plus direct distance to the end exceeds max_length
-                max_length is not None
-                and self.get_path_length(s_pos) >= max_length
+            s_full_cost, s_cost, s_pos = heapq.heappop(to_visit)
+            if (
+                search.get_visit_state(s_pos) == VisitState.Visited
+                or s_cost > search.get_cost(s_pos)
             ):
                 continue
+            if s_cost > max_cost:
+                break
 
-            if s_pos == to_pos:
-                # We found the shortest path
-                return self.path_to(to_pos)
-
-            self.set_visit_state(s_pos, VisitState.Visited)
+            search.set_visit_state(s_pos, VisitState.Visited)
+            if s_pos in to_positions:
+                # We found the shortest path to this end tile
+                to_positions.remove(s_pos)
+                if len(to_positions) == 0:
+                    return True
 
             # Discover neighbours
+            s_weight = weights[s_pos]
             neighbours = self._neighbours_of(s_pos)
             for c_pos in neighbours:
                 # Skip neighbour if already visited
-                if self.get_visit_state(c_pos) == VisitState.Visited:
+                c_state = search.get_visit_state(c_pos)
+                if c_state == VisitState.Visited:
                     continue
 
                 # Calculate cost of neighbour from this parent
                 d = dist(s_pos, c_pos)
+                c_cost = s_cost + (weights[c_pos] + s_weight) / 2 + d * path_cost
+
+                # Check if this cost is lower than any previous costs (skip neighbour if not)
+                if (
+                    c_state == VisitState.Discovered
+                    and c_cost >= search.get_cost(c_pos)
+                ):
+                    continue
+
+                # Discover neighbour
+                search.set_visit_state(c_pos, VisitState.Discovered)
+                search.set_parent(c_pos, s_pos)
+                search.set_cost(c_pos, c_cost)
+                # Use the cost as stored, so it is not stale when compared after rounding to float32
+                c_cost = float(search.get_cost(c_pos))
+                if track_lengths:
+                    search.set_path_length(c_pos, search.get_path_length(s_pos) + d)
+                c_full_cost = c_cost
+                if heuristic_pos is not None:
+                    c_full_cost += self._heuristic_of(c_pos, heuristic_pos, path_cost)
+                heapq.heappush(to_visit, (c_full_cost, c_cost, c_pos))
+
+        # No path exists to some end tile, unless there are none
+        return len(to_positions) == 0
+
+    def _find_path_constrained(
+        self,
+        from_pos: Tuple[int, int],
+        to_pos: Tuple[int, int],
+        max_length: float,
+        path_cost: float,
+    ) -> Optional[List[Tuple[int, int]]]:
+        # Run A* from the start to the end, on paths no longer than max_length.
+        # A tile can be reached by a cheaper but longer path than another,
+        # so each tile keeps all labels (cost, length) of paths to it that are not dominated,
+        # i.e. for which no other label is both at most as expensive and at most as long.
+        # Labels whose length plus the direct distance to the end exceeds max_length are dropped right away.
+
+        if dist(from_pos, to_pos) > max_length + LENGTH_TOLERANCE:
+            return None
+
+        # labels holds (cost, length, parent label index, tile) for all labels,
+        # fronts holds the indices of the non-dominated labels of each tile,
+        # and to_visit is a binary heap of (cost with heuristic, length, label index).
+        labels = [(0.0, 0.0, -1, from_pos)]
+        fronts: Dict[Tuple[int, int], List[int]] = {from_pos: [0]}
+        dominated = set()
+        to_visit = [(self._heuristic_of(from_pos, to_pos, path_cost), 0.0, 0)]
+
+        while len(to_visit) > 0:
+            _, _, s_label = heapq.heappop(to_visit)
+            if s_label in dominated:
+                continue
+            s_cost, s_length, _, s_pos = labels[s_label]
+
+            if s_pos == to_pos:
+                # We found the cheapest path that is short enough
+                path_labels = [s_label]
+                while labels[path_labels[-1]][2] != -1:
+                    path_labels += [labels[path_labels[-1]][2]]
+                path_labels.reverse()
+                return self._store_path(
+                    [labels[i][3] for i in path_labels],
+                    [labels[i][0] for i in path_labels],
+                )
+
+            self.set_visit_state(s_pos, VisitState.Visited)
+
+            for c_pos in self._neighbours_of(s_pos):
+                d = dist(s_pos, c_pos)
+                c_length = s_length + d
+                if c_length + dist(c_pos, to_pos) > max_length + LENGTH_TOLERANCE:
+                    continue
                 c_cost = (
                     s_cost
                     + (self.get_weight(c_pos) + self.get_weight(s_pos)) / 2
                     + d * path_cost
                 )
-                c_full_cost = c_cost + self._heuristic_of(c_pos, to_pos, path_cost)
 
-                # Check if this cost is lower than any previous costs (skip neighbour if not)
-                if self.get_visit_state(c_pos) == VisitState.Discovered:
-                    c_full_costs = [
-                        full_cost
-                        for (full_cost, cost, pos) in to_visit.queue
-                        if pos == c_pos
-                    ]
-                    if c_full_costs != [] and c_full_cost >= min(c_full_costs):
-                        continue
+                # Skip the label if it is dominated, and drop the labels it dominates otherwise
+                front = fronts.setdefault(c_pos, [])
+                if any(
+                    labels[i][0] <= c_cost and labels[i][1] <= c_length for i in front
+                ):
+                    continue
+                for i in front:
+                    if c_cost <= labels[i][0] and c_length <= labels[i][1]:
+                        dominated.add(i)
+                front[:] = [i for i in front if i not in dominated]
 
-                # Discover neighbour
-                self.set_visit_state(c_pos, VisitState.Discovered)
-                self.set_parent(c_pos, s_pos)
-                self.set_cost(c_pos, c_cost)
-                self.set_path_length(c_pos, self.get_path_length(s_pos) + d)
-                to_visit.put((c_full_cost, c_cost, c_pos))
+                c_label = len(labels)
+                labels += [(c_cost, c_length, s_label, c_pos)]
+                front += [c_label]
+                if self.get_visit_state(c_pos) == VisitState.Undiscovered:
+                    self.set_visit_state(c_pos, VisitState.Discovered)
+                heapq.heappush(
+                    to_visit,
+                    (
+                        c_cost + self._heuristic_of(c_pos, to_pos, path_cost),
+                        c_length,
+                        c_label,
+                    ),
+                )
 
-        # No path exists
+        # No path exists that is short enough
         return None
 
+    def _store_path(
+        self, path: List[Tuple[int, int]], costs: List[float]
+    ) -> List[Tuple[int, int]]:
+        # Store the parents, costs and path lengths along a path found without the search state in it,
+        # so the path can be read from the grid as after a normal search.
+        track_lengths = self._search.stores_path_lengths()
+        parent = INVALID_PARENT
+        length = 0.0
+        for pos, cost in zip(path, costs):
+            if parent != INVALID_PARENT:
+                length += dist(parent, pos)
+            self.set_visit_state(pos, VisitState.Visited)
+            self.set_parent(pos, parent)
+            self.set_cost(pos, cost)
+            if track_lengths:
+                self.set_path_length(pos, length)
+            parent = pos
+        return path
+
+    def _find_path_bidirectional(
+        self, from_pos: Tuple[int, int], to_pos: Tuple[int, int], path_cost: float
+    ) -> Optional[List[Tuple[int, int]]]:
+        # Run A* from both ends at once, which is valid because the edge costs are symmetric.
+        # The forward search uses the grid's own search state, the backward search a second one.
+        # Both searches use the average of the heuristics towards either end as potential,
+        # added to the costs of the forward search and subtracted from those of the backward search.
+        # This keeps both searches consistent, so they can stop as soon as
+        # the sum of their smallest keys is no less than the cost of the best path found.
+        if self._backward_search is None:
+            self._backward_search = self._create_search_state()
+
+        # A unidirectional search only reaches the end tile if it can step onto it,
+        # whereas the backward search would start from it regardless
+        if to_pos != from_pos and not self._can_enter(to_pos):
+            return None
+
+        def potential(pos: Tuple[int, int]) -> float:
+            return (
+                self._heuristic_of(pos, to_pos, path_cost)
+                - self._heuristic_of(pos, from_pos, path_cost)
+            ) / 2
+
+        # Each search is a tuple of (own state, other state, sign of the potential, open set)
+        forward = (self._search, self._backward_search, 1, [])
+        backward = (self._backward_search, self._search, -1, [])
+        for (search, _, sign, to_visit), start in zip(
+            [forward, backward], [from_pos, to_pos]
+        ):
+            # The start is discovered right away, so the other search meets this one when it reaches the start,
+            # even if this search cannot step back onto it because it is unregistered or outside the mask
+            search.set_visit_state(start, VisitState.Discovered)
+            search.set_cost(start, 0)
+            heapq.heappush(to_visit, (sign * potential(start), 0.0, start))
+
+        # The cheapest path found so far through a tile that both searches reached
+        best_cost = math.inf
+        meeting_pos = None
+        if from_pos == to_pos:
+            best_cost = 0
+            meeting_pos = from_pos
+
+        while len(forward[3]) > 0 and len(backward[3]) > 0:
+            # Stop once no path through the unvisited tiles can be cheaper than the best path
+            if forward[3][0][0] + backward[3][0][0] >= best_cost:
+                break
+
+            # Expand the search with the fewest open entries
+            search, other, sign, to_visit = (
+                forward if len(forward[3]) <= len(backward[3]) else backward
+            )
+            s_full_cost, s_cost, s_pos = heapq.heappop(to_visit)
+            if (
+                search.get_visit_state(s_pos) == VisitState.Visited
+                or s_cost > search.get_cost(s_pos)
+            ):
+                continue
+            search.set_visit_state(s_pos, VisitState.Visited)
+
+            for c_pos in self._neighbours_of(s_pos):
+                if search.get_visit_state(c_pos) == VisitState.Visited:
+                    continue
+
+                d = dist(s_pos, c_pos)
+                c_cost = (
+                    s_cost
+                    + (self.get_weight(c_pos) + self.get_weight(s_pos)) / 2
+                    + d * path_cost
+                )
+                if (
+                    search.get_visit_state(c_pos) == VisitState.Discovered
+                    and c_cost >= search.get_cost(c_pos)
+                ):
+                    continue
+
+                search.set_visit_state(c_pos, VisitState.Discovered)
+                search.set_parent(c_pos, s_pos)
+                search.set_cost(c_pos, c_cost)
+                c_cost = float(search.get_cost(c_pos))
+                heapq.heappush(
+                    to_visit,
+                    (
+                        c_cost + sign * potential(c_pos),
+                        c_cost,
+                        c_pos,
+                    ),
+                )
+
+                # Check if the searches meet at this neighbour
+                if other.get_visit_state(c_pos) != VisitState.Undiscovered:
+                    total_cost = c_cost + float(other.get_cost(c_pos))
+                    if total_cost < best_cost:
+                        best_cost = total_cost
+                        meeting_pos = c_pos
+
+        if meeting_pos is None:
+            # No path exists
+            return None
+
+        # Join both halves, and store the backward half in the grid's own search state,
+        # so the path and costs can be read from the grid as after a single search.
+        path = self._search.path_to(meeting_pos)
+        path += self._backward_search.path_to(meeting_pos)[-2::-1]
+        path = self._erase_loops(path)
+        for parent, pos in zip(path, path[1:]):
+            self.set_visit_state(pos, VisitState.Visited)
+            self.set_parent(pos, parent)
+            self.set_cost(
+                pos,
+                self.get_cost(parent)
+                + (self.get_weight(pos) + self.get_weight(parent)) / 2
+                + dist(parent, pos) * path_cost,
+            )
+        return self.path_to(to_pos)
+
+    @staticmethod
+    def _erase_loops(path: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        # Remove the loops from a path, which joined halves can only contain through zero-cost edges.
+        erased = []
+        indices = {}
+        for pos in path:
+            if pos in indices:
+                for removed in erased[indices[pos] + 1 :]:
+                    del indices[removed]
+                del erased[indices[pos] + 1 :]
+                continue
+            indices[pos] = len(erased)
+            erased.append(pos)
+        return erased
+
     def path_to_string(self, path: List[Tuple[int, int]]) -> str:
         """Format a path into a human-readable string."""
         return " -> ".join([f"{pos[0]},{pos[1]}" for pos in path])
 
-    def _weight_from_attributes(
-        self,
-        pos: Tuple[int, int],
-        base_weight: float,
-        attribute_weights: Dict[TileAttribute, float],
-    ) -> float:
-        weight = base_weight
-        for attribute, attribute_weight in attribute_weights.items():
-            if self.get_attribute(pos, attribute):
-                weight += attribute_weight
-        return weight
-
     def _init_weights_from_attributes(
         self, attribute_weights: Dict[TileAttribute, float] = {}
     ):
-        for x in range(self.dimensions.width):
-            for y in range(self.dimensions.height):
-                self.set_weight(
-                    (x, y),
-                    self._weight_from_attributes(
-                        (x, y), self.get_base_weight((x, y)), attribute_weights
-                    ),
-                )
+        # The 64-bit attribute masks are split into 8 bytes.
+        # For each byte, a table holds the summed attribute weights of all 256 bit combinations,
+        # so the weights are found with 8 table lookups per tile instead of a loop over all attributes.
+        tables = np.zeros((8, 256), dtype=self._weights.dtype)
+        combinations = np.arange(256)
+        for attribute, attribute_weight in attribute_weights.items():
+            byte, bit = divmod(int(attribute), 8)
+            tables[byte, (combinations & (1 << bit)) != 0] += attribute_weight
+
+        attribute_bytes = (
+            np.ascontiguousarray(self._attributes, dtype="<i8")
+            .view(np.uint8)
+            .reshape(self._attributes.shape + (8,))
+        )
+        weights = self._get_base_weights().astype(self._weights.dtype)
+        for byte in range(8):
+            weights += tables[byte][attribute_bytes[..., byte]]
+        self._weights = weights
+        self._min_weight_outdated = True
 
     def _correct_weights_to_paths(
         self, paths: List[List[Tuple[int, int]]], multiplier: int, radius: int
     ) -> None:
-        to_visit = [
-            (pos, 0) for path in paths for pos in path if self.get_registered(pos)
-        ]
-        for pos, _ in to_visit:
-            self.set_visit_state(pos, VisitState.Visited)
+        # Multiply the weights of the registered tiles on the paths by the multiplier.
+        # Around the paths, the multiplier diminishes linearly with the (Euclidean) distance to the nearest path,
+        # down to 1 at the radius.
+        positions = np.array(
+            [pos for path in paths for pos in path], dtype=np.int64
+        ).reshape(-1, 2)
+        if len(positions) == 0:
+            return
 
-        while len(to_visit) > 0:
-            pos, dist = to_visit.pop(0)
-            self.set_weight(
-                pos, self.get_weight(pos) * lerp(multiplier, 1, dist / radius)
+        # Only the tiles within the radius of the paths are affected
+        lower = np.maximum(positions.min(axis=0) - radius, 0)
+        upper = np.minimum(
+            positions.max(axis=0) + radius + 1,
+            [self.dimensions.width, self.dimensions.height],
+        )
+        window = (slice(lower[0], upper[0]), slice(lower[1], upper[1]))
+        on_path = np.zeros(upper - lower, dtype=np.bool_)
+        on_path[positions[:, 0] - lower[0], positions[:, 1] - lower[1]] = True
+
+        if radius > 0:
+            distances = distance_transform_edt(~on_path)
+            factors = np.where(
+                distances < radius, lerp(multiplier, 1, distances / radius), 1
             )
-            if dist >= radius:
-                continue
-            neighbours = [
-                n
-                for n in self._neighbours_of(pos)
-                if not self.get_visit_state(pos) == VisitState.Visited
-            ]
-            for neighbour in neighbours:
-                self.set_visit_state(neighbour, VisitState.Visited)
-            to_visit.extend([(n, dist + 1) for n in neighbours])
-
-        self._undiscover_all()
+        else:
+            factors = np.where(on_path, multiplier, 1)
+        self._weights[window] = np.where(
+            self._registered[window],
+            self._weights[window] * factors,
+            self._weights[window],
+        )
+        self._min_weight_outdated = True
@@ -0,0 +1,427 @@
+import heapq
+import math
+import os
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from typing import Dict, List, Optional, Tuple
+
+from .grid import Grid
+from ..helpers.hash import hierarchy_hash
+
+# Entrances spanning at least this many tiles get a node at both ends instead of one in the middle
+LONG_ENTRANCE_LENGTH = 6
+
+NEIGHBOUR_OFFSETS = [
+    (dx, dy) for dx in [-1, 0, 1] for dy in [-1, 0, 1] if (dx, dy) != (0, 0)
+]
+
+
+class HierarchicalGrid:
+    """
+    Hierarchical path finding (HPA*) on top of a grid.
+
+    The grid is split into square clusters.
+    Entrances are placed where tiles on both sides of a border between two clusters are registered,
+    and the costs between the entrances of each cluster are precomputed, which gives a much smaller abstract graph.
+    Paths are first found in the abstract graph.
+    They are then refined at full resolution, with the search limited to the clusters the abstract path passes through.
+
+    The abstract graph depends on the weights and the path cost.
+    It is kept in memory, and cached as .npz file in the cache directory if one is given.
+    Only graphs of weights that follow from a cached grid and the attribute weights are cached on disk,
+    since weights penalized by existing paths differ for every path and would never be reused.
+    """
+
+    _grid: Grid
+    _cluster_size: int
+    _cache_directory: Optional[str]
+    _graph_key: Optional[str]
+    _graph_filename: Optional[str]
+    _neighbours: Dict[Tuple[int, int], List[Tuple[Tuple[int, int], float]]]
+    _cluster_nodes: Dict[Tuple[int, int], List[Tuple[int, int]]]
+
+    def __init__(
+        self, grid: Grid, cluster_size: int, cache_directory: Optional[str] = None
+    ):
+        """
+        Arguments:
+        grid: Grid -- the grid to find paths on
+        cluster_size: int -- the width (and height) of the clusters in tiles
+
+        Optional arguments:
+        cache_directory: str -- the directory to cache the abstract graphs in, default None
+        """
+        if cluster_size < 2:
+            raise Exception("Clusters must be at least 2 tiles wide")
+        self._grid = grid
+        self._cluster_size = cluster_size
+        self._cache_directory = cache_directory
+        self._graph_key = None
+        self._graph_filename = None
+        self._neighbours = {}
+        self._cluster_nodes = {}
+
+    @property
+    def grid(self) -> Grid:
+        """Get the underlying grid."""
+        return self._grid
+
+    @property
+    def cluster_size(self) -> int:
+        """Get the width (and height) of the clusters in tiles."""
+        return self._cluster_size
+
+    @property
+    def graph_filename(self) -> Optional[str]:
+        """Get the file that the current abstract graph is cached in, or None if it is not cached on disk."""
+        return self._graph_filename
+
+    def node_count(self) -> int:
+        """Get the amount of nodes in the abstract graph."""
+        return len(self._neighbours)
+
+    def find_path(
+        self,
+        from_pos: Tuple[int, int],
+        to_pos: Tuple[int, int],
+        max_length=None,
+        path_cost=0,
+        attribute_weights=None,
+        existing_paths=None,
+        existing_path_multiplier=1,
+        existing_path_radius=0,
+        bidirectional=False,
+        verify_heuristic=False,
+        mask=None,
+        corridor_radius=0,
+    ) -> Optional[List[Tuple[int, int]]]:
+        """
+        Find a path like Grid.find_path does, with the search limited to the clusters of the abstract path.
+
+        The path is usually close to, but not always as cheap as, the path found by Grid.find_path.
+        Afterwards, the grid holds the search state of the refined path, like after Grid.find_path.
+        If no path can be found, it returns None.
+
+        The abstract graph does not take the mask into account, only the refinement does.
+
+        Takes the same optional arguments as Grid.find_path, and:
+        corridor_radius: int -- how many clusters to widen the searched corridor with on each side, default 0
+        """
+        grid = self._grid
+        grid.init_weights(
+            attribute_weights,
+            existing_paths,
+            existing_path_multiplier,
+            existing_path_radius,
+        )
+        self._load_graph(
+            path_cost,
+            attribute_weights,
+            existing_paths,
+            existing_path_multiplier,
+            existing_path_radius,
+        )
+
+        abstract_path = self._abstract_path(from_pos, to_pos, path_cost)
+        if abstract_path is None:
+            return None
+        corridor = self._corridor(abstract_path, corridor_radius)
+        if mask is not None:
+            if not isinstance(mask, np.ndarray):
+                mask = grid.polygon_mask(mask)
+            corridor &= mask
+
+        return grid.find_path(
+            from_pos,
+            to_pos,
+            max_length=max_length,
+            path_cost=path_cost,
+            bidirectional=bidirectional,
+            verify_heuristic=verify_heuristic,
+            mask=corridor,
+        )
+
+    def _cluster_of(self, pos: Tuple[int, int]) -> Tuple[int, int]:
+        return (pos[0] // self._cluster_size, pos[1] // self._cluster_size)
+
+    def _load_graph(
+        self,
+        path_cost: float,
+        attribute_weights=None,
+        existing_paths=None,
+        existing_path_multiplier=1,
+        existing_path_radius=0,
+    ) -> None:
+        # Load the abstract graph for the current weights and the given path cost,
+        # from memory or the cache if possible, and build it otherwise.
+        # The weights were just set by init_weights with the same arguments.
+        grid = self._grid
+        penalized = (
+            existing_paths is not None
+            and existing_path_multiplier > 1
+            and any(len(path) > 0 for path in existing_paths)
+        )
+        if grid.cache_key is not None and attribute_weights is not None:
+            # The weights follow from the cached grid and these arguments, so the key is made of those
+            # instead of the weights themselves
+            weight_inputs = {
+                "attribute_weights": attribute_weights,
+                "unregistered_weight": grid.unregistered_weight,
+            }
+            if penalized:
+                weight_inputs["existing_paths"] = [
+                    [[int(x), int(y)] for x, y in path] for path in existing_paths
+                ]
+                weight_inputs["existing_path_multiplier"] = existing_path_multiplier
+                weight_inputs["existing_path_radius"] = existing_path_radius
+            key = hierarchy_hash(
+                grid.cache_key, weight_inputs, self._cluster_size, path_cost
+            )
+            cached = not penalized
+        else:
+            # The weights cannot be told apart by how they were set, so they are hashed themselves
+            key = hierarchy_hash(
+                None,
+                {},
+                self._cluster_size,
+                path_cost,
+                arrays=[grid._weights, grid._registered],
+            )
+            cached = False
+        if key == self._graph_key:
+            return
+
+        filename = None
+        if self._cache_directory is not None and cached:
+            filename = os.path.join(self._cache_directory, f"hpa_{key}.npz")
+        if filename is not None and os.path.exists(filename):
+            with np.load(filename) as data:
+                nodes, edges, costs = data["nodes"], data["edges"], data["costs"]
+        else:
+            nodes, edges, costs = self._build_graph(path_cost)
+            if filename is not None:
+                if not os.path.exists(self._cache_directory):
+                    os.makedirs(self._cache_directory)
+                # Write to a temporary file first, so an interrupted run leaves no partial cache behind
+                with open(f"{filename}.tmp", "wb") as file:
+                    np.savez(file, nodes=nodes, edges=edges, costs=costs)
+                os.replace(f"{filename}.tmp", filename)
+
+        positions = [(int(x), int(y)) for x, y in nodes]
+        self._neighbours = {pos: [] for pos in positions}
+        self._cluster_nodes = {}
+        for pos in positions:
+            self._cluster_nodes.setdefault(self._cluster_of(pos), []).append(pos)
+        for (a, b), cost in zip(edges, costs):
+            self._neighbours[positions[a]].append((positions[b], float(cost)))
+            self._neighbours[positions[b]].append((positions[a], float(cost)))
+        self._graph_key = key
+        self._graph_filename = filename
+
+    def _build_graph(
+        self, path_cost: float
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Build the abstract graph, as arrays of node positions, edges between node indices and edge costs.
+        # Edges are undirected, since the costs are symmetric.
+        node_indices: Dict[Tuple[int, int], int] = {}
+        edges = []
+        costs = []
+
+        def node_index(pos: Tuple[int, int]) -> int:
+            return node_indices.setdefault(pos, len(node_indices))
+
+        # Edges between clusters
+        for a, b in self._entrances():
+            edges += [(node_index(a), node_index(b))]
+            costs += [
+                max(
+                    (self._grid.get_weight(a) + self._grid.get_weight(b)) / 2
+                    + path_cost,
+                    0,
+                )
+            ]
+
+        # Edges within clusters
+        cluster_nodes: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+        for pos in node_indices:
+            cluster_nodes.setdefault(self._cluster_of(pos), []).append(pos)
+        for cluster, positions in cluster_nodes.items():
+            x_min, y_min = (
+                cluster[0] * self._cluster_size,
+                cluster[1] * self._cluster_size,
+            )
+            cluster_costs = self._cluster_costs(cluster, positions, path_cost)
+            for i, a in enumerate(positions):
+                for b in positions[i + 1 :]:
+                    cost = cluster_costs[i, b[0] - x_min, b[1] - y_min]
+                    if np.isfinite(cost):
+                        edges += [(node_indices[a], node_indices[b])]
+                        costs += [cost]
+
+        return (
+            np.array(list(node_indices), dtype=np.int64).reshape(-1, 2),
+            np.array(edges, dtype=np.int64).reshape(-1, 2),
+            np.array(costs, dtype=np.float_),
+        )
+
+    def _entrances(self) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+        # Find the pairs of tiles through which neighbouring clusters are connected.
+        # Every run of registered tile pairs along a border between two clusters is an entrance,
+        # which gets a pair in its middle, or a pair at both ends if the run is long.
+        registered = self._grid._registered
+        size = self._cluster_size
+        pairs = []
+        for axis in [0, 1]:
+            for border in range(size, registered.shape[axis], size):
+                if axis == 0:
+                    open_pairs = registered[border - 1, :] & registered[border, :]
+                else:
+                    open_pairs = registered[:, border - 1] & registered[:, border]
+                for start in range(0, len(open_pairs), size):
+                    segment = np.asarray(open_pairs[start : start + size], np.int8)
+                    changes = np.diff(np.concatenate(([0], segment, [0])))
+                    for run_start, run_end in zip(
+                        np.flatnonzero(changes == 1), np.flatnonzero(changes == -1)
+                    ):
+                        if run_end - run_start >= LONG_ENTRANCE_LENGTH:
+                            offsets = [run_start, run_end - 1]
+                        else:
+                            offsets = [(run_start + run_end - 1) // 2]
+                        for offset in offsets:
+                            t = int(start + offset)
+                            if axis == 0:
+                                pairs += [((border - 1, t), (border, t))]
+                            else:
+                                pairs += [((t, border - 1), (t, border))]
+        return pairs
+
+    def _cluster_costs(
+        self,
+        cluster: Tuple[int, int],
+        sources: List[Tuple[int, int]],
+        path_cost: float,
+    ) -> np.ndarray:
+        # Compute the costs of the cheapest paths within a cluster from each source tile to all tiles of the cluster.
+        # Returns an array of shape (sources, cluster width, cluster height), which is inf for unreachable tiles.
+        # Negative step costs are raised to 0, which the abstract graph can do without.
+        x_min, y_min = cluster[0] * self._cluster_size, cluster[1] * self._cluster_size
+        region = (
+            slice(x_min, x_min + self._cluster_size),
+            slice(y_min, y_min + self._cluster_size),
+        )
+        registered = np.asarray(self._grid._registered[region])
+        weights = np.asarray(self._grid._weights[region], dtype=np.float_)
+        width, height = registered.shape
+        indices = np.arange(width * height).reshape(width, height)
+
+        rows, columns, costs = [], [], []
+        for dx, dy in NEIGHBOUR_OFFSETS:
+            # The tiles with a neighbour in this direction, and those neighbours
+            from_region = (
+                slice(max(-dx, 0), width - max(dx, 0)),
+                slice(max(-dy, 0), height - max(dy, 0)),
+            )
+            to_region = (
+                slice(max(dx, 0), width + min(dx, 0)),
+                slice(max(dy, 0), height + min(dy, 0)),
+            )
+            connected = registered[from_region] & registered[to_region]
+            step_costs = (weights[from_region] + weights[to_region]) / 2 + math.hypot(
+                dx, dy
+            ) * path_cost
+            rows += [indices[from_region][connected]]
+            columns += [indices[to_region][connected]]
+            costs += [np.maximum(step_costs[connected], 0)]
+
+        graph = csr_matrix(
+            (np.concatenate(costs), (np.concatenate(rows), np.concatenate(columns))),
+            shape=(width * height, width * height),
+        )
+        source_indices = [indices[x - x_min, y - y_min] for x, y in sources]
+        return dijkstra(graph, indices=source_indices).reshape(
+            len(sources), width, height
+        )
+
+    def _abstract_path(
+        self, from_pos: Tuple[int, int], to_pos: Tuple[int, int], path_cost: float
+    ) -> Optional[List[Tuple[int, int]]]:
+        # Run A* on the abstract graph, with the start and end connected to the nodes of their clusters.
+        extra_neighbours: Dict[Tuple[int, int], List[Tuple[Tuple[int, int], float]]] = (
+            {}
+        )
+        for pos in [from_pos, to_pos]:
+            cluster = self._cluster_of(pos)
+            x_min, y_min = (
+                cluster[0] * self._cluster_size,
+                cluster[1] * self._cluster_size,
+            )
+            targets = list(self._cluster_nodes.get(cluster, []))
+            if pos == from_pos and self._cluster_of(to_pos) == cluster:
+                targets += [to_pos]
+            cluster_costs = self._cluster_costs(cluster, [pos], path_cost)[0]
+            for target in targets:
+                cost = cluster_costs[target[0] - x_min, target[1] - y_min]
+                if np.isfinite(cost):
+                    extra_neighbours.setdefault(pos, []).append((target, float(cost)))
+                    extra_neighbours.setdefault(target, []).append((pos, float(cost)))
+
+        costs = {from_pos: 0.0}
+        parents = {}
+        visited = set()
+        to_visit = [
+            (self._grid._heuristic_of(from_pos, to_pos, path_cost), 0.0, from_pos)
+        ]
+        while len(to_visit) > 0:
+            _, s_cost, s_pos = heapq.heappop(to_visit)
+            if s_pos in visited or s_cost > costs[s_pos]:
+                continue
+            if s_pos == to_pos:
+                path = [to_pos]
+                while path[-1] != from_pos:
+                    path += [parents[path[-1]]]
+                path.reverse()
+                return path
+            visited.add(s_pos)
+
+            for c_pos, edge_cost in self._neighbours.get(
+                s_pos, []
+            ) + extra_neighbours.get(s_pos, []):
+                c_cost = s_cost + edge_cost
+                if c_pos in visited or c_cost >= costs.get(c_pos, math.inf):
+                    continue
+                costs[c_pos] = c_cost
+                parents[c_pos] = s_pos
+                heapq.heappush(
+                    to_visit,
+                    (
+                        c_cost + self._grid._heuristic_of(c_pos, to_pos, path_cost),
+                        c_cost,
+                        c_pos,
+                    ),
+                )
+
+        # No path exists
+        return None
+
+    def _corridor(
+        self, abstract_path: List[Tuple[int, int]], corridor_radius: int
+    ) -> np.ndarray:
+        # Get a mask of the tiles in the clusters of the abstract path, widened by the given amount of clusters.
+        width, height = self._grid.dimensions.width, self._grid.dimensions.height
+        clusters = np.zeros(
+            (
+                math.ceil(width / self._cluster_size),
+                math.ceil(height / self._cluster_size),
+            ),
+            dtype=np.bool_,
+        )
+        for pos in abstract_path:
+            cx, cy = self._cluster_of(pos)
+            clusters[
+                max(cx - corridor_radius, 0) : cx + corridor_radius + 1,
+                max(cy - corridor_radius, 0) : cy + corridor_radius + 1,
+            ] = True
+        return np.repeat(
+            np.repeat(clusters, self._cluster_size, axis=0), self._cluster_size, axis=1
+        )[:width, :height]
@@ -0,0 +1,319 @@
+import heapq
+import math
+import numpy as np
+from scipy.ndimage import binary_dilation
+from typing import Dict, List, Optional, Tuple
+
+from .grid import Grid, dist
+
+# Costs are kept as (cost, steps), compared like tuples, so every step makes a path more expensive
+# even where the step itself costs nothing. LPA* relies on that, since tiles joined by steps that cost nothing
+# would otherwise keep each other's outdated costs after their weights increase.
+# The cheapest path in this order is a cheapest path by cost alone.
+Cost = Tuple[float, int]
+UNREACHED: Cost = (math.inf, 0)
+
+
+class IncrementalPlanner:
+    """
+    Incremental path finding (LPA*) on a grid, for finding paths between the same tiles while the weights change.
+
+    The planner keeps its search tree between path finding computations.
+    When the weights change, only the tiles whose costs are affected by the change are searched again,
+    which is much quicker than searching from scratch when the weights change in a small area,
+    like after making an existing path more expensive.
+    It starts over when the start, end, path cost or mask change, or when the minimum weight decreases.
+    The registration of the tiles must not change between computations.
+    """
+
+    _grid: Grid
+    _from_pos: Optional[Tuple[int, int]]
+    _to_pos: Optional[Tuple[int, int]]
+    _path_cost: float
+    _mask_argument: object
+    _mask: Optional[np.ndarray]
+    _min_weight: float
+    _weights: Optional[np.ndarray]
+    _touched: Optional[np.ndarray]
+    _costs: Dict[Tuple[int, int], Cost]
+    _lookahead_costs: Dict[Tuple[int, int], Cost]
+    _keys: Dict[Tuple[int, int], Tuple[float, int, float]]
+    _to_visit: List[Tuple[Tuple[float, int, float], Tuple[int, int]]]
+    _expansions: int
+
+    def __init__(self, grid: Grid):
+        """
+        Arguments:
+        grid: Grid -- the grid to find paths on
+        """
+        self._grid = grid
+        self._from_pos = None
+        self._to_pos = None
+        self._path_cost = 0
+        self._mask_argument = None
+        self._mask = None
+        self._min_weight = 0
+        self._weights = None
+        self._touched = None
+        self._costs = {}
+        self._lookahead_costs = {}
+        self._keys = {}
+        self._to_visit = []
+        self._expansions = 0
+
+    @property
+    def grid(self) -> Grid:
+        """Get the underlying grid."""
+        return self._grid
+
+    @property
+    def expansions(self) -> int:
+        """Get the amount of tiles expanded by the last path finding computation."""
+        return self._expansions
+
+    def find_path(
+        self,
+        from_pos: Tuple[int, int],
+        to_pos: Tuple[int, int],
+        max_length=None,
+        path_cost=0,
+        attribute_weights=None,
+        existing_paths=None,
+        existing_path_multiplier=1,
+        existing_path_radius=0,
+        bidirectional=False,
+        verify_heuristic=False,
+        mask=None,
+    ) -> Optional[List[Tuple[int, int]]]:
+        """
+        Find the same path as Grid.find_path does, reusing the search of the previous computation where possible.
+
+        Afterwards, the grid holds the parents and costs along the path, but not those of other tiles.
+        If no path can be found, it returns None.
+
+        Takes the same optional arguments as Grid.find_path, except max_length and bidirectional, which are not supported.
+        """
+        if max_length is not None or bidirectional:
+            raise Exception(
+                "Incremental path finding does not support a maximum length or bidirectional search"
+            )
+
+        grid = self._grid
+        if grid._path_finding_has_run:
+            grid.reset()
+        grid._path_finding_has_run = True
+        grid.init_weights(
+            attribute_weights,
+            existing_paths,
+            existing_path_multiplier,
+            existing_path_radius,
+        )
+
+        if (
+            from_pos != self._from_pos
+            or to_pos != self._to_pos
+            or path_cost != self._path_cost
+            or mask is not self._mask_argument
+            or grid._min_weight < self._min_weight
+        ):
+            self._start(from_pos, to_pos, path_cost, mask)
+        else:
+            self._update_changed_weights()
+        self._weights = grid._weights.copy()
+
+        grid._mask = self._mask
+        self._expansions = 0
+        self._compute_costs()
+
+        path = self._path()
+        if path is None:
+            return None
+        grid._store_path(path, [self._costs[pos][0] for pos in path])
+        if verify_heuristic:
+            grid._verify_heuristic(path, path_cost)
+        return path
+
+    def _start(
+        self,
+        from_pos: Tuple[int, int],
+        to_pos: Tuple[int, int],
+        path_cost: float,
+        mask,
+    ) -> None:
+        # Throw away the search tree, and start a new one from the start tile.
+        grid = self._grid
+        self._from_pos = from_pos
+        self._to_pos = to_pos
+        self._path_cost = path_cost
+        self._mask_argument = mask
+        if mask is not None and not isinstance(mask, np.ndarray):
+            mask = grid.polygon_mask(mask)
+        self._mask = mask
+        # The heuristic must stay the same while the search tree is kept,
+        # which is possible as long as the minimum weight does not decrease.
+        self._min_weight = grid._min_weight
+        self._touched = np.zeros(
+            (grid.dimensions.width, grid.dimensions.height), dtype=np.bool_
+        )
+        self._costs = {}
+        self._lookahead_costs = {from_pos: (0.0, 0)}
+        self._touched[from_pos] = True
+        self._keys = {}
+        self._to_visit = []
+        self._queue(from_pos)
+
+    def _update_changed_weights(self) -> None:
+        # Recompute the lookahead costs of the tiles with a changed weight, and of their neighbours,
+        # since the costs of the steps between them changed.
+        # Only tiles next to a tile that the search touched can be affected.
+        grid = self._grid
+        changed = (self._weights != grid._weights) & binary_dilation(
+            self._touched, structure=np.ones((3, 3), dtype=np.bool_)
+        )
+        grid._mask = self._mask
+        affected = set()
+        for x, y in np.argwhere(changed):
+            pos = (int(x), int(y))
+            affected.add(pos)
+            affected.update(grid._neighbours_of(pos))
+        for pos in affected:
+            self._update(pos)
+
+    def _heuristic_of(self, pos: Tuple[int, int]) -> float:
+        # Get the heuristic like Grid does, with the minimum weight of when the search tree was started.
+        steps = max(abs(pos[0] - self._to_pos[0]), abs(pos[1] - self._to_pos[1]))
+        return steps * self._min_weight + self._path_cost * dist(pos, self._to_pos)
+
+    def _key_of(self, pos: Tuple[int, int]) -> Tuple[float, int, float]:
+        cost, steps = min(
+            self._costs.get(pos, UNREACHED), self._lookahead_costs.get(pos, UNREACHED)
+        )
+        return (cost + self._heuristic_of(pos), steps, cost)
+
+    def _step_cost(
+        self, cost: Cost, from_pos: Tuple[int, int], to_pos: Tuple[int, int]
+    ) -> Cost:
+        # Get the cost of a tile reached from a neighbour with the given cost, like Grid does.
+        weights = self._grid._weights
+        return (
+            cost[0]
+            + (float(weights[to_pos]) + float(weights[from_pos])) / 2
+            + dist(from_pos, to_pos) * self._path_cost,
+            cost[1] + 1,
+        )
+
+    def _queue(self, pos: Tuple[int, int]) -> None:
+        # Put the tile in the queue if its cost and lookahead cost differ, and take it out otherwise.
+        self._keys.pop(pos, None)
+        if self._costs.get(pos, UNREACHED) != self._lookahead_costs.get(pos, UNREACHED):
+            key = self._key_of(pos)
+            self._keys[pos] = key
+            heapq.heappush(self._to_visit, (key, pos))
+
+    def _predecessors_of(self, pos: Tuple[int, int]) -> List[Tuple[int, int]]:
+        # Get the tiles from which the search can step onto the tile.
+        # These are its neighbours, and the start tile even if it is unregistered or outside the mask,
+        # since the search starts there regardless.
+        predecessors = self._grid._neighbours_of(pos)
+        from_pos = self._from_pos
+        if (
+            from_pos != pos
+            and max(abs(pos[0] - from_pos[0]), abs(pos[1] - from_pos[1])) <= 1
+            and from_pos not in predecessors
+        ):
+            predecessors.append(from_pos)
+        return predecessors
+
+    def _update(self, pos: Tuple[int, int]) -> None:
+        # Recompute the lookahead cost of a tile from its neighbours, and queue it if needed.
+        if pos != self._from_pos:
+            lookahead_cost = min(
+                (
+                    self._step_cost(self._costs[n], n, pos)
+                    for n in self._predecessors_of(pos)
+                    if n in self._costs
+                ),
+                default=UNREACHED,
+            )
+            if lookahead_cost != UNREACHED:
+                self._lookahead_costs[pos] = lookahead_cost
+                self._touched[pos] = True
+            else:
+                self._lookahead_costs.pop(pos, None)
+        self._queue(pos)
+
+    def _top(self) -> Optional[Tuple[Tuple[float, int, float], Tuple[int, int]]]:
+        # Get the queued tile with the lowest key, skipping stale entries.
+        while len(self._to_visit) > 0:
+            key, pos = self._to_visit[0]
+            if self._keys.get(pos) == key:
+                return key, pos
+            heapq.heappop(self._to_visit)
+        return None
+
+    def _key_at_least(
+        self, key: Tuple[float, int, float], other: Tuple[float, int, float]
+    ) -> bool:
+        # Compare keys like tuples, with the first parts equal if they only differ by rounding.
+        # The first part sums a cost and a heuristic, so a tile whose key should equal the end tile's
+        # may come out slightly higher, which would stop the search before the end tile's cost is correct.
+        if other[0] == math.inf:
+            return key[0] == math.inf and key[1:] >= other[1:]
+        tolerance = 1e-9 * max(abs(other[0]), 1)
+        if abs(key[0] - other[0]) <= tolerance:
+            return key[1:] >= other[1:]
+        return key[0] > other[0]
+
+    def _compute_costs(self) -> None:
+        # Expand tiles until the cost of the end tile is known to be correct.
+        to_pos = self._to_pos
+        while True:
+            top = self._top()
+            if top is None or (
+                self._key_at_least(top[0], self._key_of(to_pos))
+                and self._costs.get(to_pos, UNREACHED)
+                == self._lookahead_costs.get(to_pos, UNREACHED)
+            ):
+                return
+            _, pos = top
+            heapq.heappop(self._to_visit)
+            del self._keys[pos]
+            self._expansions += 1
+
+            cost = self._costs.get(pos, UNREACHED)
+            lookahead_cost = self._lookahead_costs.get(pos, UNREACHED)
+            neighbours = self._grid._neighbours_of(pos)
+            if cost > lookahead_cost:
+                # The tile got cheaper, which can only make its neighbours cheaper
+                self._costs[pos] = lookahead_cost
+                for n in neighbours:
+                    n_cost = self._step_cost(lookahead_cost, pos, n)
+                    if n != self._from_pos and n_cost < self._lookahead_costs.get(
+                        n, UNREACHED
+                    ):
+                        self._lookahead_costs[n] = n_cost
+                        self._touched[n] = True
+                        self._queue(n)
+            else:
+                # The tile got more expensive, so it and its neighbours have to be recomputed
+                self._costs.pop(pos, None)
+                self._update(pos)
+                for n in neighbours:
+                    self._update(n)
+
+    def _path(self) -> Optional[List[Tuple[int, int]]]:
+        # Follow the cheapest neighbours back from the end tile to the start tile.
+        # The cheapest neighbour of a tile accounts for its whole cost with one step less,
+        # so the walk never returns to a tile and ends at the start tile, which has no steps.
+        pos = self._to_pos
+        if pos not in self._costs:
+            return None
+        path = [pos]
+        while pos != self._from_pos:
+            pos = min(
+                (n for n in self._predecessors_of(pos) if n in self._costs),
+                key=lambda n: self._step_cost(self._costs[n], n, path[-1]),
+            )
+            path += [pos]
+        path.reverse()
+        return path
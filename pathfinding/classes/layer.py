@@ -2,8 +2,15 @@ import os
 from typing import Dict, Optional, List, Tuple
 
 from .tile_attribute import TileAttribute
+from ..helpers.geometry import bgt_tiles
 from ..helpers.hash import bgt_hash, gpkg_hash, tiff_hash
-from ..helpers.transformations import linearize, rasterize
+from ..helpers.transformations import (
+    ALL_TOUCHED,
+    BURN_VALUE,
+    linearize,
+    rasterize,
+    rasterize_bands,
+)
 
 
 class Feature:
@@ -24,6 +31,11 @@ class Feature:
         self.attribute = attribute
         self.weight = weight
 
+    @property
+    def definition(self) -> str:
+        """Get everything that determines how the feature is rasterized."""
+        return f"{self.name}|{self.where}|{int(self.attribute)}"
+
 
 class Layer:
     _gml_filename: str
@@ -31,6 +43,7 @@ class Layer:
     _features: List[Feature]
     _linearized: Optional[str] = None
     _rasterized: Optional[List[Tuple[str, Feature]]] = None
+    _rasterized_single_pass: Optional[str] = None
 
     def __init__(
         self,
@@ -51,43 +64,148 @@ class Layer:
     def features(self) -> List[Feature]:
         return self._features
 
+    @property
+    def definition(self) -> str:
+        """Get everything that determines how the layer is rasterized."""
+        features = ",".join(feature.definition for feature in self._features)
+        return f"{self._gml_filename}|{self._layer_name}|{features}"
+
     @property
     def features_dict(self) -> Dict[str, Feature]:
         return {feature.name: feature for feature in self._features}
 
+    def tiles(
+        self, wkt_geometry: str, bgt_layers: List[str], input_dir: Optional[str] = None
+    ) -> List[Tuple[str, str]]:
+        """
+        Get the WKT rectangle and the BGT file of every tile that covers the geometry.
+
+        bgt_layers are the names of the layers that the tiles were downloaded with.
+        """
+        # The BGT data is stored per tile, see download_bgt_data
+        # A tile that was converted while downloading has a GeoPackage instead of a GML file,
+        # of which the geometries are already linear
+        tiles = []
+        for tile in bgt_tiles(wkt_geometry):
+            input_filename = f"{bgt_hash(tile, bgt_layers)}_{self._gml_filename}"
+            gpkg_filename = f"{os.path.splitext(input_filename)[0]}.gpkg"
+            if input_dir:
+                input_filename = os.path.join(input_dir, input_filename)
+                gpkg_filename = os.path.join(input_dir, gpkg_filename)
+            if os.path.exists(gpkg_filename):
+                input_filename = gpkg_filename
+            tiles += [(tile, input_filename)]
+        return tiles
+
+    def _gpkg_key(self, wkt_geometry: str, bgt_layers: List[str]) -> str:
+        # The GeoPackage is made from the tiles, so its key covers theirs
+        bgt_keys = [bgt_hash(tile, bgt_layers) for tile in bgt_tiles(wkt_geometry)]
+        return gpkg_hash(wkt_geometry, self._layer_name, self._gml_filename, bgt_keys)
+
+    def gpkg_filename(
+        self,
+        wkt_geometry: str,
+        bgt_layers: List[str],
+        output_dir: Optional[str] = None,
+    ) -> str:
+        """Get the name of the GeoPackage that linearize makes."""
+        gpkg_key = self._gpkg_key(wkt_geometry, bgt_layers)
+        output_filename = f"{gpkg_key}_{self._layer_name}.gpkg"
+        if output_dir:
+            output_filename = os.path.join(output_dir, output_filename)
+        return output_filename
+
+    def tiff_filename(
+        self,
+        wkt_geometry: str,
+        resolution: float,
+        bgt_layers: List[str],
+        feature: Optional[Feature] = None,
+        output_dir: Optional[str] = None,
+        outputBounds: Optional[Tuple[float, float, float, float]] = None,
+    ) -> str:
+        """
+        Get the name of the tiff that rasterize makes for the feature.
+
+        Without a feature, get the name of the tiff that rasterize_single_pass makes.
+        """
+        # The key covers everything that is burned into the tiff, and how
+        if feature is not None:
+            wheres = [feature.where]
+            burn_settings = ["value", BURN_VALUE, ALL_TOUCHED]
+        else:
+            wheres = [layer_feature.where for layer_feature in self._features]
+            burn_settings = ["bands", BURN_VALUE, ALL_TOUCHED]
+        tiff_prefix = tiff_hash(
+            self._gpkg_key(wkt_geometry, bgt_layers),
+            resolution,
+            outputBounds,
+            wheres,
+            burn_settings,
+        )
+        output_filename = f"{tiff_prefix}_{self._layer_name}.tiff"
+        if feature is not None:
+            output_filename = f"{tiff_prefix}_{self._layer_name}_{feature.name}.tiff"
+        if output_dir:
+            output_filename = os.path.join(output_dir, output_filename)
+        return output_filename
+
+    def tiff_filenames(
+        self,
+        wkt_geometry: str,
+        resolution: float,
+        bgt_layers: List[str],
+        single_pass: bool,
+        output_dir: Optional[str] = None,
+        outputBounds: Optional[Tuple[float, float, float, float]] = None,
+    ) -> List[str]:
+        """Get the names of the tiffs that rasterize, or rasterize_single_pass, makes."""
+        if single_pass:
+            if not self._features:
+                return []
+            return [
+                self.tiff_filename(
+                    wkt_geometry, resolution, bgt_layers, None, output_dir, outputBounds
+                )
+            ]
+        return [
+            self.tiff_filename(
+                wkt_geometry, resolution, bgt_layers, feature, output_dir, outputBounds
+            )
+            for feature in self._features
+        ]
+
     def linearize(
         self,
         wkt_geometry: str,
+        bgt_layers: List[str],
         input_dir: Optional[str] = None,
         output_dir: Optional[str] = None,
     ) -> str:
         if self._linearized:
             return self._linearized
 
-        bgt_prefix = bgt_hash(wkt_geometry)
-        gpkg_prefix = gpkg_hash(wkt_geometry)
-
-        input_filename = f"{bgt_prefix}_{self._gml_filename}"
-        if input_dir:
-            input_filename = os.path.join(input_dir, input_filename)
-
-        output_filename = f"{gpkg_prefix}_{self._layer_name}.gpkg"
+        output_filename = self.gpkg_filename(wkt_geometry, bgt_layers, output_dir)
         if output_dir:
-            output_filename = os.path.join(output_dir, output_filename)
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
+            # Layers are processed in parallel, so another process may create the directory at the same time
+            os.makedirs(output_dir, exist_ok=True)
 
         # if os.path.isfile(output_filename):
         #     self._linearized = output_filename
         #     return self._linearized
 
-        self._linearized = linearize(wkt_geometry, input_filename, output_filename)
+        self._linearized = linearize(
+            wkt_geometry,
+            self.tiles(wkt_geometry, bgt_layers, input_dir),
+            output_filename,
+        )
         return self._linearized
 
     def rasterize(
         self,
         wkt_geometry: str,
         resolution: float,
+        bgt_layers: List[str],
         input_dir: Optional[str] = None,
         gpkg_dir: Optional[str] = None,
         output_dir: Optional[str] = None,
@@ -96,18 +214,18 @@ class Layer:
         if self._rasterized:
             return self._rasterized
 
-        tiff_prefix = tiff_hash(wkt_geometry, resolution)
-
         outputs = []
         for feature in self._features:
-            output_filename = f"{tiff_prefix}_{self._layer_name}_{feature.name}.tiff"
+            output_filename = self.tiff_filename(
+                wkt_geometry, resolution, bgt_layers, feature, output_dir, outputBounds
+            )
             if output_dir:
-                output_filename = os.path.join(output_dir, output_filename)
-                if not os.path.exists(output_dir):
-                    os.makedirs(output_dir)
+                os.makedirs(output_dir, exist_ok=True)
 
             output = rasterize(
-                self.linearize(wkt_geometry, input_dir=input_dir, output_dir=gpkg_dir),
+                self.linearize(
+                    wkt_geometry, bgt_layers, input_dir=input_dir, output_dir=gpkg_dir
+                ),
                 output_filename,
                 where=feature.where,
                 resolution=resolution,
@@ -117,3 +235,40 @@ class Layer:
 
         self._rasterized = outputs
         return self._rasterized
+
+    def rasterize_single_pass(
+        self,
+        wkt_geometry: str,
+        resolution: float,
+        bgt_layers: List[str],
+        input_dir: Optional[str] = None,
+        gpkg_dir: Optional[str] = None,
+        output_dir: Optional[str] = None,
+        outputBounds: Optional[Tuple[float, float, float, float]] = None,
+    ) -> Optional[str]:
+        """
+        Rasterize all features into a single tiff, in which band i + 1 is burned for the i-th feature.
+
+        Returns None if the layer has no features.
+        """
+        if self._rasterized_single_pass:
+            return self._rasterized_single_pass
+        if not self._features:
+            return None
+
+        output_filename = self.tiff_filename(
+            wkt_geometry, resolution, bgt_layers, None, output_dir, outputBounds
+        )
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        self._rasterized_single_pass = rasterize_bands(
+            self.linearize(
+                wkt_geometry, bgt_layers, input_dir=input_dir, output_dir=gpkg_dir
+            ),
+            output_filename,
+            [feature.where for feature in self._features],
+            resolution=resolution,
+            outputBounds=outputBounds,
+        )
+        return self._rasterized_single_pass
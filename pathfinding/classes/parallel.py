@@ -0,0 +1,141 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+from .grid import Grid
+from .rect import Rect
+from .visualizer import Visualizer
+
+# The grid of a worker process, with its tile data in shared memory, and the weights it starts each search with
+_worker_grid: Optional[Grid] = None
+_worker_weights: Optional[np.ndarray] = None
+_worker_memory: List[shared_memory.SharedMemory] = []
+
+
+def _attach(spec: tuple) -> None:
+    # Create the grid of a worker process, of which the tile data are read-only views of the shared memory.
+    global _worker_grid, _worker_weights
+    dimensions, compact, sparse_search, remaining_base_weight, arrays = spec
+
+    views = {}
+    for name, (memory_name, shape, dtype) in arrays.items():
+        memory = shared_memory.SharedMemory(name=memory_name)
+        # Keep the memory open for as long as the worker lives
+        _worker_memory.append(memory)
+        view = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+        view.flags.writeable = False
+        views[name] = view
+
+    grid = Grid(Rect(*dimensions), compact=compact, sparse_search=sparse_search)
+    grid._attributes = views["attributes"]
+    grid._registered = views["registered"]
+    grid._base_weights = views["base_weights"]
+    grid._remaining_base_weight = remaining_base_weight
+    _worker_grid = grid
+    _worker_weights = views["weights"]
+
+
+def _find_path(
+    from_pos: Tuple[int, int],
+    to_pos: Tuple[int, int],
+    geotransform,
+    kwargs: dict,
+) -> Tuple[Optional[List[Tuple[int, int]]], list]:
+    # Find a path in a worker process, and turn it into GEOJSON features while its search state is still there.
+    grid = _worker_grid
+    # Every search starts from the weights the grid had when it was shared
+    grid._weights = _worker_weights.copy()
+    grid._min_weight_outdated = True
+    path = grid.find_path(from_pos, to_pos, **kwargs)
+    if path is None:
+        return None, []
+    return path, Visualizer([path], grid, geotransform).getFeatures()
+
+
+class ParallelPathFinder:
+    """
+    Finds independent paths on a grid in a pool of worker processes.
+
+    The attributes, registration and weights of the grid are copied into shared memory once,
+    and every worker searches a grid of read-only views of them, so the grid is not pickled for every path.
+    Only the weights and search state of a worker are its own.
+
+    Use it as a context manager, so the workers are stopped and the shared memory is freed afterwards.
+    """
+
+    _grid: Grid
+    _jobs: int
+    _memory: List[shared_memory.SharedMemory]
+    _executor: Optional[ProcessPoolExecutor]
+
+    def __init__(self, grid: Grid, jobs: int):
+        """
+        Arguments:
+        grid: Grid -- the grid to find paths on, which must not change while the workers run
+        jobs: int -- the amount of worker processes
+        """
+        if jobs < 1:
+            raise Exception("Must have at least one job")
+        self._grid = grid
+        self._jobs = jobs
+        self._memory = []
+        self._executor = None
+
+    def __enter__(self) -> "ParallelPathFinder":
+        grid = self._grid
+        arrays = {}
+        for name, array in [
+            ("attributes", grid._attributes),
+            ("registered", grid._registered),
+            ("base_weights", grid._get_base_weights()),
+            ("weights", grid._weights),
+        ]:
+            arrays[name] = self._share(np.ascontiguousarray(array))
+        spec = (
+            (grid.dimensions.width, grid.dimensions.height),
+            grid.compact,
+            grid._sparse_search,
+            grid._remaining_base_weight,
+            arrays,
+        )
+        self._executor = ProcessPoolExecutor(
+            max_workers=self._jobs, initializer=_attach, initargs=(spec,)
+        )
+        return self
+
+    def __exit__(self, *_) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for memory in self._memory:
+            memory.close()
+            memory.unlink()
+        self._memory = []
+
+    def _share(self, array: np.ndarray) -> Tuple[str, Tuple[int, ...], str]:
+        # Copy the array into new shared memory, and return what a worker needs to find it.
+        memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self._memory.append(memory)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[...] = array
+        return memory.name, array.shape, array.dtype.str
+
+    def find_paths(
+        self,
+        searches: List[Tuple[Tuple[int, int], Tuple[int, int], Dict]],
+        geotransform,
+    ) -> List[Tuple[Optional[List[Tuple[int, int]]], list]]:
+        """
+        Find the paths of all searches in parallel.
+
+        Each search is a start tile, an end tile and the optional arguments of Grid.find_path.
+        Returns, in the same order, each path (or None if it cannot be found) with its GEOJSON features (see Visualizer).
+        The features are made by the worker, since smoothing uses the search state of the path.
+        """
+        if self._executor is None:
+            raise Exception("ParallelPathFinder must be used as a context manager")
+        futures = [
+            self._executor.submit(_find_path, from_pos, to_pos, geotransform, kwargs)
+            for from_pos, to_pos, kwargs in searches
+        ]
+        return [future.result() for future in futures]
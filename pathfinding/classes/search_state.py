@@ -0,0 +1,375 @@
+import math
+import sys
+from abc import ABC, abstractmethod
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from .visit_state import VisitState
+
+INVALID_PARENT = (-1, -1)
+# Compact search states store the parent of a tile as the direction towards it:
+# (dx + 1) * 3 + (dy + 1), where dx and dy are -1, 0 or 1.
+INVALID_PARENT_DIRECTION = -1
+# Dense search states store the visit state of a tile in the lowest bits of its generation stamp
+_VISIT_STATE_BITS = 2
+_VISIT_STATES = tuple(VisitState)
+
+
+def trace_path(
+    parent_directions: np.ndarray, pos: Tuple[int, int]
+) -> List[Tuple[int, int]]:
+    """
+    Return the path from the starting point to the given point, by following the parent directions.
+
+    The parent directions are indexed by (x, y), as returned by Grid.get_cost_surface,
+    so this does not need the grid or its search state.
+    Takes time proportional to the path length.
+    """
+    path = [pos]
+    while (direction := int(parent_directions[pos])) != INVALID_PARENT_DIRECTION:
+        pos = (pos[0] + direction // 3 - 1, pos[1] + direction % 3 - 1)
+        path += [pos]
+    path.reverse()
+    return path
+
+
+class SearchState(ABC):
+    """
+    Bookkeeping of a single path finding computation on a grid.
+
+    Holds the visit state, parent, cost, heuristic and path length of each tile.
+    Tiles whose visit state was not set since the last reset are undiscovered, have no parent,
+    and have a cost, heuristic and path length of 0.
+    The visit state of a tile must be set before its other values.
+
+    Subclasses must implement all abstract methods, or they cannot be instantiated.
+    """
+
+    @abstractmethod
+    def get_visit_state(self, pos: Tuple[int, int]) -> VisitState: ...
+
+    @abstractmethod
+    def set_visit_state(self, pos: Tuple[int, int], value: VisitState): ...
+
+    @abstractmethod
+    def get_parent(self, pos: Tuple[int, int]) -> Tuple[int, int]: ...
+
+    @abstractmethod
+    def set_parent(self, pos: Tuple[int, int], value: Tuple[int, int]): ...
+
+    @abstractmethod
+    def get_cost(self, pos: Tuple[int, int]) -> float: ...
+
+    @abstractmethod
+    def set_cost(self, pos: Tuple[int, int], value: float): ...
+
+    @abstractmethod
+    def get_heuristic(self, pos: Tuple[int, int]) -> float: ...
+
+    @abstractmethod
+    def set_heuristic(self, pos: Tuple[int, int], value: float): ...
+
+    @abstractmethod
+    def get_path_length(self, pos: Tuple[int, int]) -> float: ...
+
+    @abstractmethod
+    def set_path_length(self, pos: Tuple[int, int], value: float): ...
+
+    @abstractmethod
+    def stores_path_lengths(self) -> bool:
+        """Check if path lengths are stored, rather than computed from the path when asked for."""
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Reset all tiles, so the state can be used in another path finding computation."""
+
+    @abstractmethod
+    def visited_count(self) -> int:
+        """Get the amount of visited tiles."""
+
+    @abstractmethod
+    def nbytes(self) -> int:
+        """Get the (approximate) amount of memory used by the state."""
+
+    @abstractmethod
+    def to_arrays(self, shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the costs and parent directions of the visited tiles as arrays of the given shape.
+
+        Other tiles get a NaN cost and INVALID_PARENT_DIRECTION.
+        """
+
+    def path_to(self, pos: Tuple[int, int]) -> List[Tuple[int, int]]:
+        """Return the path from the starting point to the given point, by following the parents."""
+        path = [pos]
+        while (pos := self.get_parent(pos)) != INVALID_PARENT:
+            path += [pos]
+        path.reverse()
+        return path
+
+    def _path_length_of(self, pos: Tuple[int, int]) -> float:
+        # Compute the path length of a tile from its path, for when path lengths are not stored.
+        path = self.path_to(pos)
+        return sum(math.dist(a, b) for a, b in zip(path, path[1:]))
+
+
+class DenseSearchState(SearchState):
+    """
+    Search state backed by arrays covering the whole grid, which are allocated on first use.
+
+    The visit state of every tile is stored together with the generation in which it was last set,
+    and tiles with an older generation count as undiscovered, with no parent and values of 0.
+    Resetting starts a new generation, so it takes constant time instead of rewriting all arrays.
+    Only setting the visit state stamps a tile with the current generation, so the other values
+    are read and written directly, and a tile's visit state must be set before its other values.
+
+    A compact state stores costs as float32 and parents as a direction code,
+    and only stores heuristics and path lengths once they are set.
+    """
+
+    _shape: Tuple[int, int]
+    _compact: bool
+    _generation: int
+    _stamp: int
+    _visits: Optional[np.ndarray]
+    _parents: Optional[np.ndarray]
+    _costs: Optional[np.ndarray]
+    _heuristics: Optional[np.ndarray]
+    _path_lengths: Optional[np.ndarray]
+
+    def __init__(self, shape: Tuple[int, int], compact: bool = False):
+        self._shape = shape
+        self._compact = compact
+        self._generation = 1
+        self._stamp = self._generation << _VISIT_STATE_BITS
+        self._visits = None
+        self._parents = None
+        self._costs = None
+        self._heuristics = None
+        self._path_lengths = None
+
+    def _allocate(self) -> None:
+        float_type = np.float32 if self._compact else np.float_
+        # Each visit holds (generation << _VISIT_STATE_BITS) | visit state
+        self._visits = np.zeros(self._shape, dtype=np.uint32)
+        if self._compact:
+            self._parents = np.full(
+                self._shape, INVALID_PARENT_DIRECTION, dtype=np.int8
+            )
+        else:
+            self._parents = np.empty(self._shape, dtype=(np.int_, 2))
+            self._parents[...] = INVALID_PARENT
+            self._heuristics = np.zeros(self._shape, dtype=float_type)
+            self._path_lengths = np.zeros(self._shape, dtype=float_type)
+        self._costs = np.zeros(self._shape, dtype=float_type)
+
+    def get_visit_state(self, pos: Tuple[int, int]) -> VisitState:
+        if self._visits is None:
+            return VisitState.Undiscovered
+        state = int(self._visits[pos]) - self._stamp
+        return _VISIT_STATES[state] if state >= 0 else VisitState.Undiscovered
+
+    def set_visit_state(self, pos: Tuple[int, int], value: VisitState):
+        if self._visits is None:
+            self._allocate()
+        if self._visits[pos] < self._stamp:
+            # Clear the values left by older generations, the first time the tile is stamped
+            self._parents[pos] = (
+                INVALID_PARENT_DIRECTION if self._compact else INVALID_PARENT
+            )
+            self._costs[pos] = 0
+            if self._heuristics is not None:
+                self._heuristics[pos] = 0
+            if self._path_lengths is not None:
+                self._path_lengths[pos] = 0
+        self._visits[pos] = self._stamp | value
+
+    def get_parent(self, pos: Tuple[int, int]) -> Tuple[int, int]:
+        if self._visits is None or self._visits[pos] < self._stamp:
+            return INVALID_PARENT
+        if self._compact:
+            direction = int(self._parents[pos])
+            if direction == INVALID_PARENT_DIRECTION:
+                return INVALID_PARENT
+            return (pos[0] + direction // 3 - 1, pos[1] + direction % 3 - 1)
+        p = self._parents[pos]
+        return (int(p[0]), int(p[1]))
+
+    def set_parent(self, pos: Tuple[int, int], value: Tuple[int, int]):
+        if self._compact:
+            if tuple(value) == INVALID_PARENT:
+                self._parents[pos] = INVALID_PARENT_DIRECTION
+            else:
+                self._parents[pos] = (value[0] - pos[0] + 1) * 3 + value[1] - pos[1] + 1
+            return
+        self._parents[pos] = value
+
+    def get_cost(self, pos: Tuple[int, int]) -> float:
+        if self._visits is None or self._visits[pos] < self._stamp:
+            return 0
+        return self._costs[pos]
+
+    def set_cost(self, pos: Tuple[int, int], value: float):
+        self._costs[pos] = value
+
+    def get_heuristic(self, pos: Tuple[int, int]) -> float:
+        if self._heuristics is None or self._visits[pos] < self._stamp:
+            return 0
+        return self._heuristics[pos]
+
+    def set_heuristic(self, pos: Tuple[int, int], value: float):
+        if self._heuristics is None:
+            self._heuristics = np.zeros_like(self._costs)
+        self._heuristics[pos] = value
+
+    def get_path_length(self, pos: Tuple[int, int]) -> float:
+        if self._path_lengths is None:
+            return self._path_length_of(pos)
+        if self._visits[pos] < self._stamp:
+            return 0
+        return self._path_lengths[pos]
+
+    def set_path_length(self, pos: Tuple[int, int], value: float):
+        if self._path_lengths is None:
+            self._path_lengths = np.zeros_like(self._costs)
+        self._path_lengths[pos] = value
+
+    def stores_path_lengths(self) -> bool:
+        # Non-compact states always store path lengths, even before their arrays are allocated
+        return not self._compact or self._path_lengths is not None
+
+    def reset(self) -> None:
+        self._generation += 1
+        if self._generation > np.iinfo(np.uint32).max >> _VISIT_STATE_BITS:
+            # The stamps would overflow, so clear them once and start over
+            self._visits[...] = 0
+            self._generation = 1
+        self._stamp = self._generation << _VISIT_STATE_BITS
+        if self._compact:
+            # Only store path lengths again if the next computation needs them
+            self._path_lengths = None
+
+    def visited_count(self) -> int:
+        if self._visits is None:
+            return 0
+        return int(np.count_nonzero(self._visits == self._stamp | VisitState.Visited))
+
+    def to_arrays(self, shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+        costs = np.full(shape, np.nan, dtype=np.float32 if self._compact else np.float_)
+        directions = np.full(shape, INVALID_PARENT_DIRECTION, dtype=np.int8)
+        if self._visits is None:
+            return costs, directions
+        visited = self._visits == self._stamp | VisitState.Visited
+        costs[visited] = self._costs[visited]
+        if self._compact:
+            directions[visited] = self._parents[visited]
+            return costs, directions
+        has_parent = visited & (self._parents[..., 0] != INVALID_PARENT[0])
+        xs, ys = np.nonzero(has_parent)
+        parents = self._parents[has_parent]
+        directions[has_parent] = (parents[:, 0] - xs + 1) * 3 + parents[:, 1] - ys + 1
+        return costs, directions
+
+    def nbytes(self) -> int:
+        arrays = [
+            self._visits,
+            self._parents,
+            self._costs,
+            self._heuristics,
+            self._path_lengths,
+        ]
+        return sum(array.nbytes for array in arrays if array is not None)
+
+
+class SparseSearchState(SearchState):
+    """
+    Search state backed by dictionaries, which only hold the tiles that were written to.
+
+    Its memory use and reset time scale with the amount of touched tiles instead of the grid area,
+    which suits short searches on big grids.
+    Path lengths are only stored once they are set.
+    """
+
+    _visit_states: Dict[Tuple[int, int], VisitState]
+    _parents: Dict[Tuple[int, int], Tuple[int, int]]
+    _costs: Dict[Tuple[int, int], float]
+    _heuristics: Dict[Tuple[int, int], float]
+    _path_lengths: Optional[Dict[Tuple[int, int], float]]
+
+    def __init__(self):
+        self._visit_states = {}
+        self._parents = {}
+        self._costs = {}
+        self._heuristics = {}
+        self._path_lengths = None
+
+    def get_visit_state(self, pos: Tuple[int, int]) -> VisitState:
+        return self._visit_states.get(pos, VisitState.Undiscovered)
+
+    def set_visit_state(self, pos: Tuple[int, int], value: VisitState):
+        self._visit_states[pos] = value
+
+    def get_parent(self, pos: Tuple[int, int]) -> Tuple[int, int]:
+        return self._parents.get(pos, INVALID_PARENT)
+
+    def set_parent(self, pos: Tuple[int, int], value: Tuple[int, int]):
+        self._parents[pos] = (int(value[0]), int(value[1]))
+
+    def get_cost(self, pos: Tuple[int, int]) -> float:
+        return self._costs.get(pos, 0)
+
+    def set_cost(self, pos: Tuple[int, int], value: float):
+        self._costs[pos] = float(value)
+
+    def get_heuristic(self, pos: Tuple[int, int]) -> float:
+        return self._heuristics.get(pos, 0)
+
+    def set_heuristic(self, pos: Tuple[int, int], value: float):
+        self._heuristics[pos] = float(value)
+
+    def get_path_length(self, pos: Tuple[int, int]) -> float:
+        if self._path_lengths is None:
+            return self._path_length_of(pos)
+        return self._path_lengths.get(pos, 0)
+
+    def set_path_length(self, pos: Tuple[int, int], value: float):
+        if self._path_lengths is None:
+            self._path_lengths = {}
+        self._path_lengths[pos] = float(value)
+
+    def stores_path_lengths(self) -> bool:
+        return self._path_lengths is not None
+
+    def reset(self) -> None:
+        self._visit_states.clear()
+        self._parents.clear()
+        self._costs.clear()
+        self._heuristics.clear()
+        self._path_lengths = None
+
+    def visited_count(self) -> int:
+        return sum(
+            1 for state in self._visit_states.values() if state == VisitState.Visited
+        )
+
+    def to_arrays(self, shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+        costs = np.full(shape, np.nan, dtype=np.float_)
+        directions = np.full(shape, INVALID_PARENT_DIRECTION, dtype=np.int8)
+        for pos, state in self._visit_states.items():
+            if state != VisitState.Visited:
+                continue
+            costs[pos] = self._costs.get(pos, 0)
+            parent = self._parents.get(pos, INVALID_PARENT)
+            if parent != INVALID_PARENT:
+                directions[pos] = (parent[0] - pos[0] + 1) * 3 + parent[1] - pos[1] + 1
+        return costs, directions
+
+    def nbytes(self) -> int:
+        dicts = [
+            self._visit_states,
+            self._parents,
+            self._costs,
+            self._heuristics,
+            self._path_lengths or {},
+        ]
+        return sum(sys.getsizeof(d) for d in dicts)
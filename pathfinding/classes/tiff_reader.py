@@ -1,9 +1,12 @@
 import rasterio
+from rasterio.errors import RasterBlockError
 import os
-from typing import Tuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import List, Tuple, Union
 
 from typing import Optional
-from .layer import Layer
+from .layer import Feature, Layer
 from .tile_attribute import TileAttribute
 from .grid import Grid
 from .rect import Rect
@@ -13,6 +16,25 @@ from .tile_data import TileData
 class TiffReader:
     """Import tiff files"""
 
+    def _read_blocks(tiff, band=1):
+        # Read a band of the raster one internal block at a time, so only one block is in memory.
+        # Yields the non-empty blocks with their windows.
+        for (i, j), window in tiff.block_windows(band):
+            try:
+                tiff.block_size(band, i, j)
+            except RasterBlockError:
+                # Sparse block that was never written, so nothing was burned into it
+                continue
+
+            block = tiff.read(band, window=window)
+            if tiff.nodata is not None:
+                block[block == tiff.nodata] = 0
+            if not block.any():
+                continue
+
+            # Rasterio reads arrays as (row, column), whereas the grid is indexed by (x, y)
+            yield block.T, (window.col_off, window.row_off)
+
     def _read_tiff(grid: Grid, src: str, attribute: TileAttribute, base_weight=0):
         if not os.path.exists(src):
             print(f"warning: skipping tiff {src}")
@@ -20,16 +42,58 @@ class TiffReader:
 
         print(f"reading tiff file {src}")
         with rasterio.open(src) as tiff:
-            array = tiff.read(1)
-            for y in range(len(array)):
-                for x in range(len(array[y])):
-                    if array[y][x] > 0:
-                        grid.register_tile_at(
-                            (x, y), base_weight=base_weight, attributes=[attribute]
-                        )
+            for block, offset in TiffReader._read_blocks(tiff):
+                grid.register_tiles(
+                    block > 0,
+                    base_weight=base_weight,
+                    attributes=[attribute],
+                    offset=offset,
+                )
         print("done reading tiff file")
         return grid
 
+    def _read_bands_tiff(grid: Grid, src: str, features: List[Feature], base_weight=0):
+        # Read a tiff made by Layer.rasterize_single_pass, in which band i + 1 is burned for the i-th feature.
+        if not os.path.exists(src):
+            print(f"warning: skipping tiff {src}")
+            return grid
+
+        print(f"reading tiff file {src}")
+        with rasterio.open(src) as tiff:
+            for band, feature in enumerate(features, start=1):
+                for block, offset in TiffReader._read_blocks(tiff, band):
+                    grid.register_tiles(
+                        block > 0,
+                        base_weight=base_weight,
+                        attributes=[feature.attribute],
+                        offset=offset,
+                    )
+        print("done reading tiff file")
+        return grid
+
+    def _rasterize_layer(
+        layer: Layer, single_pass: bool, **kwargs
+    ) -> Union[Optional[str], List[Tuple[str, Feature]]]:
+        # Linearize and rasterize a layer, without touching the grid, so it can run in a worker process
+        if single_pass:
+            return layer.rasterize_single_pass(**kwargs)
+        return layer.rasterize(**kwargs)
+
+    def _read_layer(
+        grid: Grid,
+        layer: Layer,
+        rasterized: Union[Optional[str], List[Tuple[str, Feature]]],
+        single_pass: bool,
+    ):
+        # Load the output of _rasterize_layer into the grid
+        if single_pass:
+            if rasterized is not None:
+                TiffReader._read_bands_tiff(grid, rasterized, layer.features)
+            return
+
+        for tiff, feature in rasterized:
+            TiffReader._read_tiff(grid, tiff, feature.attribute)
+
     def read_tiffs(
         grid: Grid,
         layer: Layer,
@@ -39,14 +103,66 @@ class TiffReader:
         gpkg_dir: Optional[str] = None,
         output_dir: Optional[str] = None,
         outputBounds: Optional[Tuple[float, float, float, float]] = None,
+        single_pass: bool = False,
+        bgt_layers: Optional[List[str]] = None,
     ):
-        tiffs = layer.rasterize(
+        """
+        Rasterize the layer's features and load them into the grid.
+
+        With single_pass, all features are rasterized into the bands of one tiff.
+        bgt_layers are the names of the layers that the BGT data was downloaded with, by default just this layer.
+        """
+        TiffReader.read_layers(
+            grid,
+            [layer],
             wkt_geometry,
             resolution,
             input_dir=input_dir,
             gpkg_dir=gpkg_dir,
             output_dir=output_dir,
             outputBounds=outputBounds,
+            single_pass=single_pass,
+            bgt_layers=bgt_layers,
         )
-        for tiff, feature in tiffs:
-            TiffReader._read_tiff(grid, tiff, feature.attribute)
+
+    def read_layers(
+        grid: Grid,
+        layers: List[Layer],
+        wkt_geometry: str,
+        resolution: float,
+        input_dir: Optional[str] = None,
+        gpkg_dir: Optional[str] = None,
+        output_dir: Optional[str] = None,
+        outputBounds: Optional[Tuple[float, float, float, float]] = None,
+        single_pass: bool = False,
+        jobs: int = 1,
+        bgt_layers: Optional[List[str]] = None,
+    ):
+        """
+        Rasterize the features of all layers and load them into the grid.
+
+        The layers are linearized and rasterized independently by a pool of `jobs` processes.
+        Loading the tiffs into the grid happens in this process, in the order of the layers.
+        bgt_layers are the names of the layers that the BGT data was downloaded with, by default these layers.
+        """
+        if bgt_layers is None:
+            bgt_layers = [layer.layer_name for layer in layers]
+        rasterize_layer = partial(
+            TiffReader._rasterize_layer,
+            single_pass=single_pass,
+            wkt_geometry=wkt_geometry,
+            resolution=resolution,
+            bgt_layers=bgt_layers,
+            input_dir=input_dir,
+            gpkg_dir=gpkg_dir,
+            output_dir=output_dir,
+            outputBounds=outputBounds,
+        )
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                rasterized = list(executor.map(rasterize_layer, layers))
+        else:
+            rasterized = map(rasterize_layer, layers)
+
+        for layer, layer_rasterized in zip(layers, rasterized):
+            TiffReader._read_layer(grid, layer, layer_rasterized, single_pass)
@@ -0,0 +1,64 @@
+import rasterio
+from rasterio.transform import from_origin
+import numpy as np
+import os
+from typing import Tuple
+
+from .grid import Grid
+from .search_state import INVALID_PARENT_DIRECTION
+
+
+class TiffWriter:
+    """Export tiff files"""
+
+    def _write_tiff(
+        dst: str,
+        array: np.ndarray,
+        nodata,
+        outputBounds: Tuple[float, float, float, float],
+        resolution: float,
+    ):
+        # Write an array indexed by (x, y) as a tiled tiff, with the same geotransform as the rasterized layers.
+        x_min, _, _, y_max = outputBounds
+        with rasterio.open(
+            dst,
+            "w",
+            driver="GTiff",
+            width=array.shape[0],
+            height=array.shape[1],
+            count=1,
+            dtype=array.dtype,
+            crs="EPSG:28992",
+            transform=from_origin(x_min, y_max, resolution, resolution),
+            nodata=nodata,
+            tiled=True,
+            compress="lzw",
+        ) as tiff:
+            # The grid is indexed by (x, y), whereas rasterio writes arrays as (row, column)
+            tiff.write(array.T, 1)
+
+    def write_cost_surface(
+        grid: Grid,
+        dst: str,
+        outputBounds: Tuple[float, float, float, float],
+        resolution: float,
+    ) -> Tuple[str, str]:
+        """
+        Write the costs and parent directions of the last search on the grid to <dst>_cost.tif and <dst>_parents.tif.
+
+        Tiles that were not visited have no data.
+        Paths can be traced back from the parent directions with trace_path, after transposing the raster.
+        Returns the names of both files.
+        """
+        directory = os.path.dirname(dst)
+        if directory != "" and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        costs, directions = grid.get_cost_surface()
+        cost_dst = f"{dst}_cost.tif"
+        parents_dst = f"{dst}_parents.tif"
+        TiffWriter._write_tiff(cost_dst, costs, np.nan, outputBounds, resolution)
+        TiffWriter._write_tiff(
+            parents_dst, directions, INVALID_PARENT_DIRECTION, outputBounds, resolution
+        )
+        return cost_dst, parents_dst
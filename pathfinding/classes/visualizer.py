@@ -163,8 +163,14 @@ class Visualizer:
 
         return real_coordinates
 
-    def getGEOJSON(self, name: str = "path"):
-        pathfeatures = [
+    def getFeatures(self, properties=None) -> list:
+        """
+        Get the smoothed paths as GEOJSON LineString features.
+
+        Optionally, properties holds a dictionary of feature properties for each path.
+        Smoothing uses the costs of the grid, so this must be called before the grid is searched again.
+        """
+        return [
             {
                 "type": "Feature",
                 "geometry": {
@@ -176,20 +182,24 @@ class Visualizer:
                         )
                     ],
                 },
+                "properties": {} if properties is None else properties[i],
                 # style doesn't work
                 # "style": {
                 #     "fill": "blue",
                 #     "stroke-width": "3",
                 # },
             }
-            for path in self.paths
+            for i, path in enumerate(self.paths)
             if path is not None
         ]
 
+    @staticmethod
+    def writeGEOJSON(features: list, name: str = "path"):
+        """Write the features as a GEOJSON FeatureCollection to the file GEOJSON_DATA_PATH/<name>.geojson."""
         dictionary = {
             "type": "FeatureCollection",
             "crs": {"type": "name", "properties": {"name": "EPSG:28992"}},
-            "features": pathfeatures,
+            "features": features,
         }
 
         if not os.path.exists(GEOJSON_DATA_PATH):
@@ -197,6 +207,9 @@ class Visualizer:
         with open(os.path.join(GEOJSON_DATA_PATH, name + ".geojson"), "w") as f:
             json.dump(dictionary, f, indent=4)
 
+    def getGEOJSON(self, name: str = "path"):
+        Visualizer.writeGEOJSON(self.getFeatures(), name)
+
     def show(self):
         for path in self.paths:
             colour = (
@@ -1,5 +1,7 @@
 BGT_DATA_PATH = ".bgt_data"
 GPKG_DATA_PATH = ".gpkg_data"
 TIFF_DATA_PATH = ".tiff_data"
+GRID_DATA_PATH = ".grid_data"
+CACHE_MANIFEST_PATH = ".cache_manifest.sqlite"
 GEOJSON_DATA_PATH = "output"
 CONFIG_DATA_PATH = "config.json"
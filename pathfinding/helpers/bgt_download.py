@@ -1,28 +1,119 @@
 import os
 import shutil
 import requests
-import json
 import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from typing import List, Tuple, Optional
+from urllib3.util.retry import Retry
 from zipfile import ZipFile
 
 from ..constants.paths import BGT_DATA_PATH
+from ..helpers.geometry import bgt_tiles
 from ..helpers.hash import bgt_hash
+from ..helpers.transformations import convert_to_gpkg
+
+PDOK_API_URL = "https://api.pdok.nl"
+BGT_CUSTOM_DOWNLOAD_PATH = "/lv/bgt/download/v1_0/full/custom"
+# Seconds to wait for connecting to, and for each read from, the server
+REQUEST_TIMEOUT = (10, 60)
+# The status of a download is first polled after POLL_DELAY seconds,
+# and the delay grows by a factor POLL_BACKOFF after each poll, up to MAX_POLL_DELAY seconds
+POLL_DELAY = 0.5
+POLL_BACKOFF = 1.5
+MAX_POLL_DELAY = 8
+# Bytes written to disk at once while downloading
+CHUNK_SIZE = 1 << 20
+
+
+def bgt_session(jobs: int = 1) -> requests.Session:
+    """
+    Create a session that keeps up to `jobs` connections open, for downloading that many tiles at once.
+
+    Failed GET requests are retried a few times, with an exponentially growing delay.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=jobs,
+        pool_maxsize=jobs,
+        max_retries=Retry(
+            total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504]
+        ),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 
 def download_bgt_data(
-    wkt_geometry: str, layer_names: str
+    wkt_geometry: str,
+    layer_names: List[str],
+    jobs: int = 4,
+    convert: bool = False,
+    base_url: str = PDOK_API_URL,
 ) -> Tuple[bool, Optional[str]]:
-    path_prefix = os.path.join(BGT_DATA_PATH, bgt_hash(wkt_geometry))
+    """
+    Download the BGT data of all tiles that cover the geometry, and that are not cached yet.
+
+    Up to `jobs` tiles are requested and downloaded at once, over a shared pool of connections.
+    The files of a tile are stored in BGT_DATA_PATH, prefixed with the bgt_hash of the tile's WKT rectangle and the layers.
+    If convert is set, the GML files are stored as linearized GeoPackages instead (see download_bgt_tile).
+    """
+    tiles = bgt_tiles(wkt_geometry)
+    missing = [
+        tile
+        for tile in tiles
+        if not os.path.exists(
+            os.path.join(BGT_DATA_PATH, f"{bgt_hash(tile, layer_names)}.zip")
+        )
+    ]
+    if len(missing) == 0:
+        return True, "taken from cache"
+
+    print(f"Downloading {len(missing)} BGT tiles..")
+    with bgt_session(jobs) as session, ThreadPoolExecutor(jobs) as executor:
+        results = list(
+            executor.map(
+                lambda tile: download_bgt_tile(
+                    tile, layer_names, session, convert, base_url
+                ),
+                missing,
+            )
+        )
+    for success, reason in results:
+        if not success:
+            return False, reason
+
+    return True, f"{len(tiles) - len(missing)} of {len(tiles)} tiles taken from cache"
+
+
+def download_bgt_tile(
+    wkt_geometry: str,
+    layer_names: List[str],
+    session: Optional[requests.Session] = None,
+    convert: bool = False,
+    base_url: str = PDOK_API_URL,
+) -> Tuple[bool, Optional[str]]:
+    """
+    Download the BGT data within the geometry with a custom download, unless it is cached.
+
+    The archive is streamed to disk, and its members are copied out of it in chunks,
+    so neither is ever held in memory as a whole.
+    If convert is set, every GML file is converted into a linearized GeoPackage of the same name,
+    read directly from the archive, so the GML file itself is never extracted.
+    """
+    path_prefix = os.path.join(BGT_DATA_PATH, bgt_hash(wkt_geometry, layer_names))
     zip_path = f"{path_prefix}.zip"
+    # GDAL only reads from archives of which the name ends in .zip
+    temporary_zip_path = f"{path_prefix}.tmp.zip"
 
     if os.path.exists(zip_path):
         return True, "taken from cache"
 
-    if not os.path.exists(BGT_DATA_PATH):
-        os.makedirs(BGT_DATA_PATH)
+    os.makedirs(BGT_DATA_PATH, exist_ok=True)
+    if session is None:
+        session = bgt_session()
 
-    url = "https://api.pdok.nl/lv/bgt/download/v1_0/full/custom"
     head = {"accept": "application/json", "Content-Type": "application/json"}
     stat_head = {"accept": "application/json"}
     data = {
@@ -31,35 +122,64 @@ def download_bgt_data(
         "geofilter": wkt_geometry,
     }
 
-    # Request data
-    response = requests.post(url, headers=head, json=data)
-    if response.status_code != 202:
-        return False, response._content.decode("utf-8")
-    response_load = json.loads(response.text)
-
-    # Check server status
-    stat_link = "https://api.pdok.nl" + response_load["_links"]["status"]["href"]
-    status = json.loads(requests.get(stat_link, headers=stat_head).text)["status"]
-    if not status in ["PENDING", "RUNNING", "COMPLETED"]:
-        return False, status
-    while status != "COMPLETED":
-        time.sleep(0.5)
-        status_load = json.loads(requests.get(stat_link, headers=stat_head).text)
-        status = status_load["status"]
-
-    # Create download link
-    download_link = "https://api.pdok.nl" + status_load["_links"]["download"]["href"]
-
-    # Save files
-    dl_file = requests.get(download_link)
-    open(zip_path, "wb").write(dl_file.content)
-    with ZipFile(zip_path, "r") as zip:
-        # We do not use zip.extractall, because it does not perform sanitization
+    try:
+        # Request data
+        response = session.post(
+            base_url + BGT_CUSTOM_DOWNLOAD_PATH,
+            headers=head,
+            json=data,
+            timeout=REQUEST_TIMEOUT,
+        )
+        if response.status_code != 202:
+            return False, response.text
+        stat_link = base_url + response.json()["_links"]["status"]["href"]
+
+        # Check server status until the download is ready
+        delay = POLL_DELAY
+        while True:
+            status_load = session.get(
+                stat_link, headers=stat_head, timeout=REQUEST_TIMEOUT
+            ).json()
+            status = status_load["status"]
+            if status == "COMPLETED":
+                break
+            if not status in ["PENDING", "RUNNING"]:
+                return False, status
+            time.sleep(delay)
+            delay = min(delay * POLL_BACKOFF, MAX_POLL_DELAY)
+
+        # Save files
+        # The zip is moved into place last, so an interrupted download is not taken from the cache
+        download_link = base_url + status_load["_links"]["download"]["href"]
+        with session.get(download_link, stream=True, timeout=REQUEST_TIMEOUT) as dl:
+            if dl.status_code != 200:
+                return False, f"Download failed with status {dl.status_code}"
+            with open(temporary_zip_path, "wb") as file:
+                for chunk in dl.iter_content(chunk_size=CHUNK_SIZE):
+                    file.write(chunk)
+    except requests.RequestException as e:
+        return False, str(e)
+
+    # Extract every member straight to its prefixed name, or convert it to a GeoPackage without extracting it
+    with ZipFile(temporary_zip_path, "r") as zip:
         for file in zip.infolist():
-            zip.extract(file, BGT_DATA_PATH)
-            shutil.move(
-                os.path.join(BGT_DATA_PATH, file.filename),
-                f"{path_prefix}_{file.filename}",
-            )
+            # Only the file name is used, so no files are written outside BGT_DATA_PATH
+            member_name = os.path.basename(file.filename)
+            if file.is_dir() or member_name == "":
+                continue
+            if convert:
+                gpkg_name = f"{path_prefix}_{os.path.splitext(member_name)[0]}.gpkg"
+                convert_to_gpkg(
+                    f"/vsizip/{temporary_zip_path}/{file.filename}", gpkg_name
+                )
+            else:
+                with zip.open(file) as source, open(
+                    f"{path_prefix}_{member_name}.tmp", "wb"
+                ) as destination:
+                    shutil.copyfileobj(source, destination, CHUNK_SIZE)
+                os.replace(
+                    f"{path_prefix}_{member_name}.tmp", f"{path_prefix}_{member_name}"
+                )
+    os.replace(temporary_zip_path, zip_path)
 
     return True, None
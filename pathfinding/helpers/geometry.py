@@ -1,3 +1,10 @@
+import math
+import re
+
+# Width (and height) in meters of the tiles of the RD grid in which BGT data is downloaded and cached
+BGT_TILE_SIZE = 1000
+
+
 def wkt_rect_from_corners(start_corner: tuple[int, int], opposite_corner: tuple[int, int], padding=0) -> str :
     """
     Generate a WKT rectangular POLYGON between two corners.
@@ -15,4 +22,33 @@ def wkt_rect_from_corners(start_corner: tuple[int, int], opposite_corner: tuple[
     up = int(max (start_corner[1], opposite_corner[1]) + vertical_dist*padding)
     down = int(min(start_corner[1], opposite_corner[1]) - vertical_dist*padding)
 
-    return f"POLYGON(({left} {down}, {left} {up}, {right} {up}, {right} {down}, {left} {down}))"
\ No newline at end of file
+    return f"POLYGON(({left} {down}, {left} {up}, {right} {up}, {right} {down}, {left} {down}))"
+
+
+def bounds_from_wkt(wkt_geometry: str) -> tuple[float, float, float, float]:
+    """
+    Get the bounding box (x_min, y_min, x_max, y_max) of all coordinates in a WKT geometry.
+    """
+
+    numbers = [float(number) for number in re.findall(r"-?\d+(?:\.\d+)?", wkt_geometry)]
+    xs = numbers[0::2]
+    ys = numbers[1::2]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def bgt_tiles(wkt_geometry: str) -> list[str]:
+    """
+    Get the WKT rectangles of the BGT tiles that cover the bounding box of the geometry.
+
+    The tiles are aligned to multiples of BGT_TILE_SIZE, so overlapping geometries share tiles.
+    """
+    x_min, y_min, x_max, y_max = bounds_from_wkt(wkt_geometry)
+    x_start = math.floor(x_min / BGT_TILE_SIZE) * BGT_TILE_SIZE
+    y_start = math.floor(y_min / BGT_TILE_SIZE) * BGT_TILE_SIZE
+    x_end = max(math.ceil(x_max / BGT_TILE_SIZE) * BGT_TILE_SIZE, x_start + BGT_TILE_SIZE)
+    y_end = max(math.ceil(y_max / BGT_TILE_SIZE) * BGT_TILE_SIZE, y_start + BGT_TILE_SIZE)
+    return [
+        wkt_rect_from_corners((x, y), (x + BGT_TILE_SIZE, y + BGT_TILE_SIZE))
+        for x in range(x_start, x_end, BGT_TILE_SIZE)
+        for y in range(y_start, y_end, BGT_TILE_SIZE)
+    ]
@@ -1,20 +1,65 @@
 import hashlib
+import json
+import numpy as np
+from typing import Iterable, List, Optional, Tuple
 
+# Bump this when the way cached files are made changes, so files made the old way are no longer used
+CACHE_VERSION = 2
 
-def bgt_hash(wkt_geometry: str) -> str:
-    h = hashlib.new("sha256")
-    h.update(wkt_geometry.encode())
-    return h.hexdigest()[:8]
 
+def cache_key(stage: str, *inputs, arrays: Iterable[np.ndarray] = ()) -> str:
+    """
+    Get the key of a cached file: the full SHA-256 digest of everything that determines its content.
 
-def gpkg_hash(wkt_geometry: str) -> str:
-    h = hashlib.new("sha256")
-    h.update(wkt_geometry.encode())
-    return h.hexdigest()[:8]
+    The inputs must be JSON serializable. They are encoded as one JSON list, so different inputs never
+    share an encoding. Arrays are hashed by their shape, type and contents.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps([CACHE_VERSION, stage, *inputs]).encode())
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        h.update(json.dumps([array.shape, array.dtype.str]).encode())
+        h.update(array)
+    return h.hexdigest()
 
 
-def tiff_hash(wkt_geometry: str, resolution: float) -> str:
-    diversifier = f"{wkt_geometry} {resolution}"
-    h = hashlib.new("sha256")
-    h.update(diversifier.encode())
-    return h.hexdigest()[:8]
+def bgt_hash(wkt_geometry: str, layer_names: List[str]) -> str:
+    # A download contains only the requested layers, so they are part of the key
+    return cache_key("bgt", wkt_geometry, sorted(layer_names))
+
+
+def gpkg_hash(
+    wkt_geometry: str, layer_name: str, gml_filename: str, bgt_keys: List[str]
+) -> str:
+    return cache_key("gpkg", wkt_geometry, layer_name, gml_filename, bgt_keys)
+
+
+def tiff_hash(
+    gpkg_key: str,
+    resolution: float,
+    outputBounds: Optional[Tuple[float, float, float, float]],
+    wheres: List[Optional[str]],
+    burn_settings: list,
+) -> str:
+    return cache_key("tiff", gpkg_key, resolution, outputBounds, wheres, burn_settings)
+
+
+def grid_hash(
+    tiff_keys: List[str],
+    layer_definitions: List[str],
+    single_pass: bool,
+) -> str:
+    return cache_key("grid", tiff_keys, layer_definitions, single_pass)
+
+
+def hierarchy_hash(
+    grid_key: Optional[str],
+    weight_inputs: dict,
+    cluster_size: int,
+    path_cost: float,
+    arrays: Iterable[np.ndarray] = (),
+) -> str:
+    # The weights are identified either by what they were set from, or by the arrays themselves
+    return cache_key(
+        "hierarchy", grid_key, weight_inputs, cluster_size, path_cost, arrays=arrays
+    )
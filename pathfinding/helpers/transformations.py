@@ -1,31 +1,95 @@
 import os
 import subprocess
 from osgeo import gdal, gdalconst
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 
 
-def linearize(wkt_geometry: str, input_filename: str, output_filename: str):
+def linearize(
+    wkt_geometry: str, tiles: List[Tuple[str, str]], output_filename: str
+) -> str:
+    """
+    Linearize the BGT tiles, given as (WKT rectangle, GML filename), into one GeoPackage clipped to the geometry.
+
+    Every tile is clipped to its own rectangle as well, so features that cross tile borders are not included twice.
+    Tiles of which the file does not exist are skipped.
+    If all of them are skipped, no GeoPackage is written.
+    """
     if os.path.exists(output_filename):
         print(f"{output_filename} already exists, skipping linearization..")
         return output_filename
 
-    print(f"Linearizing {input_filename} to {output_filename}")
+    # Merge into a temporary file first, so an interrupted run leaves no partial GeoPackage behind
+    temporary_filename = f"{output_filename}.tmp"
+    if os.path.exists(temporary_filename):
+        os.remove(temporary_filename)
+    for tile_geometry, input_filename in tiles:
+        if not os.path.exists(input_filename):
+            print(f"warning: skipping {input_filename}")
+            continue
+
+        print(f"Linearizing {input_filename} to {output_filename}")
+        subprocess.run(
+            [
+                "ogr2ogr",
+                "-f",
+                "GPKG",
+                *(["-append"] if os.path.exists(temporary_filename) else []),
+                "-nlt",
+                "CONVERT_TO_LINEAR",
+                "-skipfailures",
+                "-clipsrc",
+                tile_geometry,
+                "-clipdst",
+                wkt_geometry,
+                temporary_filename,
+                input_filename,
+            ],
+            check=True,
+        )
+    if not os.path.exists(temporary_filename):
+        print(f"warning: no tiles to linearize, skipping {output_filename}")
+        return output_filename
+    os.replace(temporary_filename, output_filename)
+    return output_filename
+
+
+def convert_to_gpkg(input_filename: str, output_filename: str) -> str:
+    """
+    Convert a vector file into a GeoPackage with linear geometries.
+
+    The input may be a GDAL virtual path, such as a file within an archive under /vsizip/.
+    """
+    if os.path.exists(output_filename):
+        print(f"{output_filename} already exists, skipping conversion..")
+        return output_filename
+
+    temporary_filename = f"{output_filename}.tmp"
+    if os.path.exists(temporary_filename):
+        os.remove(temporary_filename)
+    print(f"Converting {input_filename} to {output_filename}")
     subprocess.run(
         [
             "ogr2ogr",
+            "-f",
+            "GPKG",
             "-nlt",
             "CONVERT_TO_LINEAR",
             "-skipfailures",
-            "-clipdst",
-            wkt_geometry,
-            output_filename,
+            temporary_filename,
             input_filename,
         ],
         check=True,
     )
+    os.replace(temporary_filename, output_filename)
     return output_filename
 
 
+# Value burned into the pixels of a geometry by rasterize and rasterize_bands
+BURN_VALUE = 255
+# Whether rasterize and rasterize_bands burn all pixels that a geometry touches, instead of those whose center it covers
+ALL_TOUCHED = True
+
+
 def rasterize(
     input_filename: str,
     output_filename: str,
@@ -36,15 +100,18 @@ def rasterize(
     if os.path.exists(output_filename):
         print(f"{output_filename} already exists, skipping rasterization..")
         return output_filename
+    if not os.path.exists(input_filename):
+        print(f"warning: skipping rasterization of missing {input_filename}")
+        return output_filename
 
     print(f"Rasterizing {input_filename} to {output_filename}")
     gdal.Rasterize(
         output_filename,
         input_filename,
         options=gdal.RasterizeOptions(
-            burnValues=[255],
-            allTouched=True,
-            creationOptions=["COMPRESS=LZW", "TILED=YES"],
+            burnValues=[BURN_VALUE],
+            allTouched=ALL_TOUCHED,
+            creationOptions=["COMPRESS=LZW", "TILED=YES", "SPARSE_OK=TRUE"],
             outputType=gdalconst.GDT_Byte,
             xRes=resolution,
             yRes=resolution,
@@ -53,3 +120,71 @@ def rasterize(
         ),
     )
     return output_filename
+
+
+def rasterize_bands(
+    input_filename: str,
+    output_filename: str,
+    wheres: List[Optional[str]],
+    resolution: float = 1.0,  # in meters
+    outputBounds: Optional[Tuple[float, float, float, float]] = None,
+) -> str:
+    """
+    Rasterize multiple where clauses into one raster, with a band per where clause.
+
+    Band i + 1 is burned like rasterize burns wheres[i] into its own raster,
+    so geometries that share a pixel keep the bands of all where clauses they match.
+    A where clause of None matches all geometries.
+    """
+    if os.path.exists(output_filename):
+        print(f"{output_filename} already exists, skipping rasterization..")
+        return output_filename
+    if not os.path.exists(input_filename):
+        print(f"warning: skipping rasterization of missing {input_filename}")
+        return output_filename
+
+    # The CityGML tables are not named after the layer, so burn all of them
+    vector = gdal.OpenEx(input_filename, gdal.OF_VECTOR)
+    tables = [vector.GetLayer(i).GetName() for i in range(vector.GetLayerCount())]
+    vector = None
+
+    print(f"Rasterizing {input_filename} to {output_filename}")
+    output = None
+    for band, where in enumerate(wheres, start=1):
+        if output is None:
+            # GDAL burns the same value into every band of one call, and creates a band per burn value,
+            # so the first call creates all bands and only burns the first
+            output = gdal.Rasterize(
+                output_filename,
+                input_filename,
+                options=gdal.RasterizeOptions(
+                    burnValues=[BURN_VALUE] + [0] * (len(wheres) - 1),
+                    layers=tables,
+                    where=where,
+                    allTouched=ALL_TOUCHED,
+                    creationOptions=[
+                        "COMPRESS=LZW",
+                        "TILED=YES",
+                        "SPARSE_OK=TRUE",
+                        "INTERLEAVE=BAND",
+                    ],
+                    outputType=gdalconst.GDT_Byte,
+                    xRes=resolution,
+                    yRes=resolution,
+                    outputBounds=outputBounds,
+                ),
+            )
+        else:
+            gdal.Rasterize(
+                output,
+                input_filename,
+                options=gdal.RasterizeOptions(
+                    bands=[band],
+                    burnValues=[BURN_VALUE],
+                    layers=tables,
+                    where=where,
+                    allTouched=ALL_TOUCHED,
+                ),
+            )
+    output = None  # Closing the dataset flushes it to disk
+    return output_filename
@@ -0,0 +1,141 @@
+import io
+import json
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+import pytest
+
+
+class PdokStandIn:
+    """
+    Local stand-in of the PDOK BGT custom download API, to point the base_url of the download functions at.
+
+    Every POST is accepted as a custom download request with a status link, the status is RUNNING
+    for the first `polls` polls and `final_status` afterwards, and the download is a zip with one GML file
+    of `member_size` bytes that tells which request it belongs to.
+    """
+
+    def __init__(
+        self,
+        polls: int = 1,
+        final_status: str = "COMPLETED",
+        post_status: int = 202,
+        post_delay: float = 0,
+        download_delay: float = 0,
+        member_size: int = 10000,
+    ):
+        self.polls = polls
+        self.final_status = final_status
+        self.post_status = post_status
+        self.post_delay = post_delay
+        self.download_delay = download_delay
+        self.member_size = member_size
+        # The path and body of every download request, and how often its status was polled
+        self.requests: List[Tuple[str, dict]] = []
+        self.status_polls: Dict[int, int] = {}
+        self.downloads = 0
+        self.max_concurrent_downloads = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "PdokStandIn":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def member(self, i: int) -> bytes:
+        """Get the contents of the GML file in the download of the i'th request."""
+        line = f"<gml>request {i}</gml>\n".encode()
+        return (line * (self.member_size // len(line) + 1))[: self.member_size]
+
+    def _zip(self, i: int) -> bytes:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("bgt_wegdeel.gml", self.member(i))
+        return buffer.getvalue()
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *_):
+                pass
+
+            def send(self, code: int, body, content_type="application/json"):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode()
+                try:
+                    self.send_response(code)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped waiting, like after a timeout
+                    pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                time.sleep(stand_in.post_delay)
+                if stand_in.post_status != 202:
+                    return self.send(stand_in.post_status, {"message": "server error"})
+                with stand_in._lock:
+                    i = len(stand_in.requests)
+                    stand_in.requests.append((self.path, body))
+                    stand_in.status_polls[i] = 0
+                self.send(202, {"_links": {"status": {"href": f"/status/{i}"}}})
+
+            def do_GET(self):
+                kind, i = self.path.strip("/").split("/")
+                i = int(i)
+                if kind == "status":
+                    with stand_in._lock:
+                        stand_in.status_polls[i] += 1
+                        polls = stand_in.status_polls[i]
+                    if polls <= stand_in.polls:
+                        return self.send(200, {"status": "RUNNING"})
+                    return self.send(
+                        200,
+                        {
+                            "status": stand_in.final_status,
+                            "_links": {"download": {"href": f"/download/{i}"}},
+                        },
+                    )
+                with stand_in._lock:
+                    stand_in.downloads += 1
+                    active = stand_in.downloads
+                    stand_in.max_concurrent_downloads = max(
+                        stand_in.max_concurrent_downloads, active
+                    )
+                time.sleep(stand_in.download_delay)
+                with stand_in._lock:
+                    stand_in.downloads -= 1
+                self.send(200, stand_in._zip(i), "application/zip")
+
+        return Handler
+
+
+@pytest.fixture
+def pdok(tmp_path, monkeypatch):
+    """
+    Start PDOK stand-ins with the given settings, in a temporary working directory so BGT_DATA_PATH starts out empty.
+    """
+    monkeypatch.chdir(tmp_path)
+    stand_ins = []
+
+    def start(**settings) -> PdokStandIn:
+        stand_ins.append(PdokStandIn(**settings).start())
+        return stand_ins[-1]
+
+    yield start
+    for stand_in in stand_ins:
+        stand_in.stop()
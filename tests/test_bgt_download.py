@@ -0,0 +1,96 @@
+import os
+import types
+
+import pytest
+
+pytest.importorskip("osgeo")
+
+from pathfinding.helpers import bgt_download, wkt_rect_from_corners
+from pathfinding.helpers.bgt_download import download_bgt_data, download_bgt_tile
+from pathfinding.constants.paths import BGT_DATA_PATH
+from pathfinding.helpers.geometry import bgt_tiles
+from pathfinding.helpers.hash import bgt_hash
+
+LAYERS = ["wegdeel"]
+# Nine tiles of a square kilometer
+AREA = wkt_rect_from_corners((100500, 400500), (102500, 402500))
+# A single tile
+TILE = bgt_tiles(wkt_rect_from_corners((100500, 400500), (100600, 400600)))[0]
+
+
+def cached_files():
+    return sorted(os.listdir(BGT_DATA_PATH)) if os.path.exists(BGT_DATA_PATH) else []
+
+
+def test_downloads_tiles_concurrently(pdok, monkeypatch):
+    # Write in chunks smaller than the files, so both the download and the extraction are streamed
+    monkeypatch.setattr(bgt_download, "CHUNK_SIZE", 1000)
+    monkeypatch.setattr(bgt_download, "POLL_DELAY", 0.01)
+    stand_in = pdok(download_delay=0.2, member_size=50000)
+    tiles = bgt_tiles(AREA)
+
+    success, reason = download_bgt_data(AREA, LAYERS, jobs=4, base_url=stand_in.url)
+
+    assert success, reason
+    assert stand_in.max_concurrent_downloads > 1
+    assert len(stand_in.requests) == len(tiles)
+    for path, body in stand_in.requests:
+        assert path == bgt_download.BGT_CUSTOM_DOWNLOAD_PATH
+        assert body["featuretypes"] == LAYERS
+    for i, (_, body) in enumerate(stand_in.requests):
+        prefix = os.path.join(BGT_DATA_PATH, bgt_hash(body["geofilter"], LAYERS))
+        assert os.path.exists(f"{prefix}.zip")
+        with open(f"{prefix}_bgt_wegdeel.gml", "rb") as file:
+            assert file.read() == stand_in.member(i)
+    assert not any(".tmp" in file for file in cached_files())
+
+    # Every tile is cached now, so nothing is requested again
+    assert download_bgt_data(AREA, LAYERS, jobs=4, base_url=stand_in.url) == (
+        True,
+        "taken from cache",
+    )
+    assert len(stand_in.requests) == len(tiles)
+
+
+def test_polls_status_with_backoff(pdok, monkeypatch):
+    monkeypatch.setattr(bgt_download, "POLL_DELAY", 0.01)
+    monkeypatch.setattr(bgt_download, "POLL_BACKOFF", 2)
+    monkeypatch.setattr(bgt_download, "MAX_POLL_DELAY", 0.05)
+    sleeps = []
+    monkeypatch.setattr(
+        bgt_download, "time", types.SimpleNamespace(sleep=sleeps.append)
+    )
+    stand_in = pdok(polls=5)
+
+    assert download_bgt_tile(TILE, LAYERS, base_url=stand_in.url) == (True, None)
+    assert stand_in.status_polls == {0: 6}
+    assert sleeps == pytest.approx([0.01, 0.02, 0.04, 0.05, 0.05])
+
+
+def test_failed_request(pdok):
+    stand_in = pdok(post_status=500)
+
+    success, reason = download_bgt_tile(TILE, LAYERS, base_url=stand_in.url)
+
+    assert not success
+    assert "server error" in reason
+    assert cached_files() == []
+
+
+def test_failed_download(pdok, monkeypatch):
+    monkeypatch.setattr(bgt_download, "POLL_DELAY", 0.01)
+    stand_in = pdok(final_status="FAILED")
+
+    assert download_bgt_data(AREA, LAYERS, base_url=stand_in.url) == (False, "FAILED")
+    assert not any(file.endswith(".zip") for file in cached_files())
+
+
+def test_timed_out_request(pdok, monkeypatch):
+    monkeypatch.setattr(bgt_download, "REQUEST_TIMEOUT", (1, 0.1))
+    stand_in = pdok(post_delay=1)
+
+    success, reason = download_bgt_tile(TILE, LAYERS, base_url=stand_in.url)
+
+    assert not success
+    assert "timed out" in reason
+    assert cached_files() == []
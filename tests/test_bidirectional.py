@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+
+from pathfinding.classes import Grid, Rect
+
+
+def random_grid(rng: np.random.Generator) -> Grid:
+    grid = Grid(Rect(15, 12))
+    weights = rng.integers(0, 4, size=(15, 12))
+    registered = rng.random((15, 12)) < 0.8
+    for weight in range(4):
+        grid.register_tiles(registered & (weights == weight), base_weight=weight)
+    return grid
+
+
+@pytest.mark.parametrize("masked", [False, True])
+@pytest.mark.parametrize("path_cost", [0, 0.5])
+def test_same_costs_as_unidirectional(masked, path_cost):
+    for seed in range(100):
+        rng = np.random.default_rng(seed)
+        grid = random_grid(rng)
+        # The start and end may be unregistered or outside the mask
+        from_pos = (int(rng.integers(15)), int(rng.integers(12)))
+        to_pos = (int(rng.integers(15)), int(rng.integers(12)))
+        if rng.random() < 0.5:
+            grid.set_registered(from_pos, False)
+        mask = rng.random((15, 12)) < 0.9 if masked else None
+
+        expected = grid.find_path(from_pos, to_pos, path_cost=path_cost, mask=mask)
+        expected_cost = grid.get_cost(to_pos) if expected is not None else None
+        path = grid.find_path(
+            from_pos, to_pos, path_cost=path_cost, mask=mask, bidirectional=True
+        )
+        if expected is None:
+            assert path is None
+            continue
+        assert path[0] == from_pos and path[-1] == to_pos
+        for a, b in zip(path, path[1:]):
+            assert max(abs(a[0] - b[0]), abs(a[1] - b[1])) == 1
+            assert grid.get_registered(b) and (mask is None or mask[b])
+        assert grid.get_cost(to_pos) == pytest.approx(expected_cost)
+        assert grid.path_to(to_pos) == path
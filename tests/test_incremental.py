@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+
+from pathfinding.classes import Grid, IncrementalPlanner, Rect
+
+
+def random_grid(rng: np.random.Generator, registered_fraction: float) -> Grid:
+    # Weights of 0 are common, so many steps cost nothing without a path cost
+    grid = Grid(Rect(15, 12))
+    weights = rng.integers(0, 4, size=(15, 12))
+    registered = rng.random((15, 12)) < registered_fraction
+    for weight in range(4):
+        grid.register_tiles(registered & (weights == weight), base_weight=weight)
+    return grid
+
+
+def assert_valid_path(grid: Grid, path, from_pos, to_pos):
+    assert path[0] == from_pos and path[-1] == to_pos
+    assert len(set(path)) == len(path)
+    for a, b in zip(path, path[1:]):
+        assert max(abs(a[0] - b[0]), abs(a[1] - b[1])) == 1
+        assert grid.get_registered(b)
+
+
+@pytest.mark.parametrize("registered_fraction", [1.0, 0.8])
+@pytest.mark.parametrize("path_cost", [0, 0.5])
+def test_same_paths_as_find_path(registered_fraction, path_cost):
+    for seed in range(30):
+        rng = np.random.default_rng(seed)
+        grid = random_grid(rng, registered_fraction)
+        reference = random_grid(np.random.default_rng(seed), registered_fraction)
+        planner = IncrementalPlanner(grid)
+        from_pos = (int(rng.integers(15)), int(rng.integers(12)))
+        to_pos = (int(rng.integers(15)), int(rng.integers(12)))
+        # The start may be unregistered, the end must be registered to be reachable
+        grid.set_registered(to_pos, True)
+        reference.set_registered(to_pos, True)
+
+        existing_paths = []
+        for _ in range(4):
+            arguments = dict(
+                path_cost=path_cost,
+                attribute_weights={},
+                existing_paths=existing_paths,
+                existing_path_multiplier=3,
+                existing_path_radius=1,
+            )
+            expected = reference.find_path(from_pos, to_pos, **arguments)
+            path = planner.find_path(from_pos, to_pos, **arguments)
+            if expected is None:
+                assert path is None
+                break
+            assert_valid_path(grid, path, from_pos, to_pos)
+            assert grid.get_cost(to_pos) == pytest.approx(reference.get_cost(to_pos))
+            assert grid.path_to(to_pos) == path
+            existing_paths = existing_paths + [expected]
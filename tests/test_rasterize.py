@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+
+from osgeo import ogr, osr
+
+from pathfinding.classes import Feature, Grid, Rect, TiffReader, TileAttribute
+from pathfinding.helpers.transformations import rasterize, rasterize_bands
+
+BOUNDS = (0, 0, 8, 5)
+# Both squares touch the pixel column from x = 4 to 5, so their pixels overlap
+GEOMETRIES = [
+    ("a", "POLYGON ((0.5 0.5, 4.5 0.5, 4.5 4.5, 0.5 4.5, 0.5 0.5))"),
+    ("b", "POLYGON ((4.2 0.5, 7.5 0.5, 7.5 4.5, 4.2 4.5, 4.2 0.5))"),
+]
+FEATURES = [
+    Feature("a", "name = 'a'", TileAttribute.Wegdeel_Voetpad, 1),
+    Feature("b", "name = 'b'", TileAttribute.Wegdeel_Fietspad, 1),
+    Feature("all", None, TileAttribute.Wegdeel_Inrit, 1),
+]
+
+
+def write_gpkg(filename: str) -> str:
+    source = ogr.GetDriverByName("GPKG").CreateDataSource(filename)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(28992)
+    layer = source.CreateLayer("wegdeel", srs, ogr.wkbPolygon)
+    layer.CreateField(ogr.FieldDefn("name", ogr.OFTString))
+    for name, wkt in GEOMETRIES:
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetField("name", name)
+        feature.SetGeometry(ogr.CreateGeometryFromWkt(wkt))
+        layer.CreateFeature(feature)
+    source = None
+    return filename
+
+
+def test_bands_match_per_feature_tiffs(tmp_path):
+    gpkg = write_gpkg(str(tmp_path / "wegdeel.gpkg"))
+    per_feature = Grid(Rect(8, 5))
+    for feature in FEATURES:
+        tiff = rasterize(
+            gpkg,
+            str(tmp_path / f"{feature.name}.tiff"),
+            where=feature.where,
+            outputBounds=BOUNDS,
+        )
+        TiffReader._read_tiff(per_feature, tiff, feature.attribute)
+    single_pass = Grid(Rect(8, 5))
+    tiff = rasterize_bands(
+        gpkg,
+        str(tmp_path / "bands.tiff"),
+        [feature.where for feature in FEATURES],
+        outputBounds=BOUNDS,
+    )
+    TiffReader._read_bands_tiff(single_pass, tiff, FEATURES)
+
+    assert np.array_equal(single_pass._registered, per_feature._registered)
+    assert np.array_equal(single_pass._attributes, per_feature._attributes)
+    # The shared pixels keep the attributes of both squares
+    shared = sum(1 << feature.attribute for feature in FEATURES[:2])
+    assert ((single_pass._attributes[4, 1:4] & shared) == shared).all()